@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+Benchmark desimodel.focalplane.FocalPlane.xy2radec on large arrays
+
+Compares the accuracy and throughput of xy2radec and plate_angle against
+the previous implementation, which inverted plate_dist with a
+finite-difference Newton iteration over all elements until every
+element converged.
+
+Example:
+    focalplane_benchmark.py --npoints 10000000
+"""
+
+from __future__ import print_function, division
+import time
+import argparse
+import numpy as np
+
+from desimodel.focalplane import FocalPlane
+
+parser = argparse.ArgumentParser(usage = "%(prog)s [options]")
+parser.add_argument("-n", "--npoints", type=float, default=1e7,
+    help="number of random focal plane positions [%(default)s]")
+parser.add_argument("--rmax", type=float, default=420.0,
+    help="maximum focal plane radius in mm [%(default)s]")
+parser.add_argument("--seed", type=int, default=1,
+    help="random seed [%(default)s]")
+args = parser.parse_args()
+
+class FiniteDifferenceFocalPlane(FocalPlane):
+    """FocalPlane with the previous plate_angle implementation"""
+    def plate_angle(self, radius):
+        angle_guess = 0.0 * radius
+        dist_guess = self.plate_dist(angle_guess) - radius
+        while np.any(np.fabs(dist_guess) > 1E-8):
+            derivative = (self.plate_dist(angle_guess+1E-5) -
+                          self.plate_dist(angle_guess))/1E-5
+            delta_guess = - dist_guess/derivative
+            angle_guess = angle_guess + delta_guess
+            dist_guess = self.plate_dist(angle_guess) - radius
+        return angle_guess
+
+def timeit(func, *args):
+    t0 = time.time()
+    result = func(*args)
+    return time.time() - t0, result
+
+npoints = int(args.npoints)
+print('Generating {} random focal plane positions'.format(npoints))
+rng = np.random.RandomState(args.seed)
+r = args.rmax * np.sqrt(rng.uniform(0, 1, npoints))
+phi = rng.uniform(0, 2*np.pi, npoints)
+x, y = r*np.cos(phi), r*np.sin(phi)
+
+new = FocalPlane(150.0, 30.0)
+old = FiniteDifferenceFocalPlane(150.0, 30.0)
+
+print('{:>12s} {:>12s} {:>12s} {:>10s}'.format(
+    'function', 'old [s]', 'new [s]', 'speedup'))
+told, angle_old = timeit(old.plate_angle, r)
+tnew, angle_new = timeit(new.plate_angle, r)
+print('{:>12s} {:12.3f} {:12.3f} {:10.2f}'.format(
+    'plate_angle', told, tnew, told/tnew))
+told, (ra_old, dec_old) = timeit(old.xy2radec, x, y)
+tnew, (ra_new, dec_new) = timeit(new.xy2radec, x, y)
+print('{:>12s} {:12.3f} {:12.3f} {:10.2f}'.format(
+    'xy2radec', told, tnew, told/tnew))
+
+print()
+print('max |plate_dist(plate_angle(r)) - r| [mm]: old {:.2e} new {:.2e}'.format(
+    np.max(np.abs(old.plate_dist(angle_old) - r)),
+    np.max(np.abs(new.plate_dist(angle_new) - r))))
+dra = np.remainder(ra_new - ra_old + 180, 360) - 180
+dra *= np.cos(np.radians(dec_old))
+print('max new - old xy2radec offset [arcsec]: RA {:.2e} Dec {:.2e}'.format(
+    3600*np.max(np.abs(dra)), 3600*np.max(np.abs(dec_new - dec_old))))
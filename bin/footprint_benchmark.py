@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Benchmark desimodel.footprint queries on large random catalogs
+
+Times is_point_in_desi and find_tiles_over_point(output='csr') on
+uniform random points over the full sky, scanning the number of
+threads given with --nproc, then compares the same queries with
+spatial_sort=True against the unsorted ones.
+
+Example:
+    footprint_benchmark.py --npoints 100000000 --nproc 1 2 4 8 16 32 64
+"""
+
+from __future__ import print_function, division
+import sys
+import time
+import argparse
+import numpy as np
+
+import desimodel.io
+import desimodel.footprint
+
+parser = argparse.ArgumentParser(usage = "%(prog)s [options]")
+parser.add_argument("-n", "--npoints", type=float, default=1e8,
+    help="number of random points [%(default)s]")
+parser.add_argument("--nproc", type=int, nargs='+',
+    default=[1, 2, 4, 8, 16, 32, 64],
+    help="numbers of threads to benchmark [%(default)s]")
+parser.add_argument("--seed", type=int, default=1,
+    help="random seed [%(default)s]")
+parser.add_argument("--nocsr", action="store_true",
+    help="skip find_tiles_over_point(output='csr') timing")
+parser.add_argument("--nosort", action="store_true",
+    help="skip spatial_sort=True timing")
+args = parser.parse_args()
+
+npoints = int(args.npoints)
+tiles = desimodel.io.load_tiles()
+index = desimodel.footprint.get_tile_index(tiles)
+
+print('Generating {} random points'.format(npoints))
+rng = np.random.RandomState(args.seed)
+ra = rng.uniform(0, 360, npoints)
+dec = np.degrees(np.arcsin(rng.uniform(-1, 1, npoints)))
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - t0, result
+
+print('{:>6s} {:>22s} {:>8s} {:>22s} {:>8s}'.format(
+    'nproc', 'is_point_in_desi [s]', 'speedup', 'csr tiles/point [s]', 'speedup'))
+t1 = c1 = None
+indesi1 = counts1 = None
+unsorted = dict()
+for nproc in args.nproc:
+    t, indesi = timeit(desimodel.footprint.is_point_in_desi,
+                       index, ra, dec, nproc=nproc)
+    if t1 is None:
+        t1, indesi1 = t, indesi
+    elif np.any(indesi != indesi1):
+        print('ERROR: is_point_in_desi(nproc={}) differs from nproc={}'.format(
+            nproc, args.nproc[0]))
+        sys.exit(1)
+
+    if args.nocsr:
+        c, counts = np.nan, None
+    else:
+        c, (offsets, indices, counts) = timeit(
+            desimodel.footprint.find_tiles_over_point,
+            index, ra, dec, output='csr', nproc=nproc)
+        del offsets, indices
+        if c1 is None:
+            c1, counts1 = c, counts
+        elif np.any(counts != counts1):
+            print('ERROR: find_tiles_over_point(nproc={}) differs'.format(nproc))
+            sys.exit(1)
+
+    unsorted[nproc] = (t, c)
+    print('{:6d} {:22.2f} {:8.2f} {:22.2f} {:8.2f}'.format(
+        nproc, t, t1/t, c, (c1 or np.nan)/c))
+    sys.stdout.flush()
+
+if args.nosort:
+    sys.exit(0)
+
+print()
+print('spatial_sort=True, speedup relative to unsorted with the same nproc')
+print('{:>6s} {:>22s} {:>8s} {:>22s} {:>8s}'.format(
+    'nproc', 'is_point_in_desi [s]', 'speedup', 'csr tiles/point [s]', 'speedup'))
+for nproc in args.nproc:
+    t, indesi = timeit(desimodel.footprint.is_point_in_desi,
+                       index, ra, dec, nproc=nproc, spatial_sort=True)
+    if np.any(indesi != indesi1):
+        print('ERROR: is_point_in_desi(spatial_sort=True) differs from unsorted')
+        sys.exit(1)
+
+    if args.nocsr:
+        c = np.nan
+    else:
+        c, (offsets, indices, counts) = timeit(
+            desimodel.footprint.find_tiles_over_point,
+            index, ra, dec, output='csr', nproc=nproc, spatial_sort=True)
+        del offsets, indices
+        if np.any(counts != counts1):
+            print('ERROR: find_tiles_over_point(spatial_sort=True) differs from unsorted')
+            sys.exit(1)
+
+    print('{:6d} {:22.2f} {:8.2f} {:22.2f} {:8.2f}'.format(
+        nproc, t, unsorted[nproc][0]/t, c, unsorted[nproc][1]/c))
+    sys.stdout.flush()
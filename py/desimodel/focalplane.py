@@ -9,9 +9,7 @@ Provides utilities to model the DESI focal plane.
 """
 
 
-import os
 import numpy as np
-from astropy.io import fits
 import astropy.units as u
 
 # Define this here to avoid a problem with Sphinx compilation.
@@ -120,15 +118,213 @@ def get_tile_radius_deg():
     '''Returns radius in degrees to the middle of the outermost positioner'''
     global _tile_radius_deg
     if _tile_radius_deg is None:
-        import scipy.interpolate
-        import desimodel.io
         rmax = get_tile_radius_mm()
-        platescale = desimodel.io.load_platescale()
-        fn = scipy.interpolate.interp1d(platescale['radius'], platescale['theta'], kind='quadratic')
-        _tile_radius_deg = float(fn(rmax))
+        _tile_radius_deg = float(np.degrees(_platescale_angle(rmax)))
 
     return _tile_radius_deg
 
+def _check_radec(ra, dec):
+    """Raise ValueError if RA or dec are out of bounds.
+    """
+    if np.any( (ra < 0) | (ra >= 360) ):
+        raise ValueError("RA must be 0 <= RA < 360")
+    if np.any( (dec < -90) | (dec > +90) ):
+        raise ValueError("Dec must be -90 <= dec <= 90")
+
+#- plate_dist polynomial coefficients, highest order first
+_plate_dist_coeffs = np.array([8.297E5, -1750.0, 1.394E4, 0.0])
+
+def _plate_dist(theta):
+    """Radial distance on the plate (mm) at angle `theta` (radians)"""
+    p = _plate_dist_coeffs
+    radius = 0.0
+    for i in range(4):
+        radius = theta*radius + p[i]
+    return radius
+
+def _plate_dist_derivative(theta):
+    """Derivative of :func:`_plate_dist` (mm/radian) at `theta` (radians)"""
+    p = _plate_dist_coeffs
+    return (3*p[0]*theta + 2*p[1])*theta + p[2]
+
+def _plate_angle(radius):
+    """Inverse of :func:`_plate_dist` by Newton-Raphson iteration"""
+    radius = np.asarray(radius, dtype=float)
+    # Start from the linear term of plate_dist; this converges for all
+    # radii on the focal plane in about three iterations.
+    angle = radius / _plate_dist_coeffs[2]
+    for i in range(50):
+        residual = _plate_dist(angle) - radius
+        active = np.fabs(residual) > 1E-8
+        if not np.any(active):
+            break
+        angle = angle - np.where(
+            active, residual / _plate_dist_derivative(angle), 0.0)
+    return angle
+
+#- arcsec per radian, to convert um/arcsec platescales to mm/radian
+_arcsec_per_radian = 180.0*3600.0/np.pi
+
+def _hermite(x, y, dydx, xnew):
+    """Evaluate the cubic Hermite spline through (x, y) with derivatives
+    `dydx` at `xnew`, extrapolating the end segments.
+    """
+    i = np.clip(np.searchsorted(x, xnew, side='right') - 1, 0, len(x) - 2)
+    h = x[i+1] - x[i]
+    t = (xnew - x[i]) / h
+    return ((1 + 2*t) * (1 - t)**2 * y[i] + t * (1 - t)**2 * h * dydx[i] +
+            t**2 * (3 - 2*t) * y[i+1] + t**2 * (t - 1) * h * dydx[i+1])
+
+_platescale_transform = None
+def _get_platescale_transform(nsample=4096):
+    """Returns cached uniform-grid lookup tables of the platescale.txt
+    focal plane transform.
+
+    The radius versus angle table of :func:`desimodel.io.load_platescale`
+    is interpolated with a cubic Hermite spline (:func:`_hermite`) whose
+    derivative is the radial platescale, and the inverse with the reciprocal derivative.
+    Both splines, and the radial and azimuthal platescales, are then
+    sampled on uniform grids of `nsample` points so that evaluation is a
+    single gather and linear interpolation per point; see :func:`_lerp`.
+
+    Returns a dict with keys
+
+        theta: (theta0, dtheta, radius) uniform grid of radius [mm] vs angle [radians]
+        radius: (radius0, dradius, theta) uniform grid of angle [radians] vs radius [mm]
+        platescale: (radius0, dradius, radial, az) platescales [um/arcsec] vs radius [mm]
+        center_scale: radius/angle [mm/radian] at the center of the focal plane
+
+    The tables are rebuilt if the platescale table cache is reloaded.
+    """
+    global _platescale_transform
+    import desimodel.io
+    platescale = desimodel.io.load_platescale()
+    if _platescale_transform is None or _platescale_transform[0] is not platescale:
+        radius = platescale['radius']
+        theta = np.radians(platescale['theta'])
+        drdtheta = platescale['radial_platescale'] * 1E-3 * _arcsec_per_radian
+        theta_grid = np.linspace(theta[0], theta[-1], nsample)
+        radius_grid = np.linspace(radius[0], radius[-1], nsample)
+        dtheta = theta_grid[1] - theta_grid[0]
+        dradius = radius_grid[1] - radius_grid[0]
+        tables = dict(
+            theta=(theta_grid[0], dtheta,
+                _hermite(theta, radius, drdtheta, theta_grid)),
+            radius=(radius_grid[0], dradius,
+                _hermite(radius, theta, 1.0/drdtheta, radius_grid)),
+            platescale=(radius_grid[0], dradius,
+                np.interp(radius_grid, radius, platescale['radial_platescale']),
+                np.interp(radius_grid, radius, platescale['az_platescale'])),
+            center_scale=platescale['az_platescale'][0] * 1E-3 * _arcsec_per_radian,
+            )
+        for value in tables.values():
+            if isinstance(value, tuple):
+                value[-1].flags.writeable = False
+        _platescale_transform = (platescale, tables)
+    return _platescale_transform[1]
+
+def _lerp(x, x0, dx, y):
+    """Linearly interpolate `y` sampled on the uniform grid x0 + i*dx at `x`,
+    extrapolating linearly beyond the ends of the grid.
+    """
+    u = (np.asarray(x, dtype=float) - x0) / dx
+    i = np.clip(np.floor(u).astype(np.int64), 0, len(y) - 2)
+    f = u - i
+    return y[i] + f*(y[i+1] - y[i])
+
+def _platescale_dist(theta):
+    """Radial distance on the plate (mm) at angle `theta` (radians),
+    from the platescale.txt table"""
+    return _lerp(theta, *_get_platescale_transform()['theta'])
+
+def _platescale_angle(radius):
+    """Angle (radians) at radial distance `radius` (mm) on the plate,
+    from the platescale.txt table"""
+    return _lerp(radius, *_get_platescale_transform()['radius'])
+
+def get_platescale(radius):
+    """Returns the (radial, azimuthal) platescales in um/arcsec at `radius`.
+
+    Parameters
+    ----------
+    radius : :class:`float` or :class:`numpy.ndarray`
+        Radial distance on the focal plane in mm.
+
+    Returns
+    -------
+    :func:`tuple`
+        Radial (meridional) and azimuthal (sagittal) platescales in
+        um/arcsec, interpolated from platescale.txt.
+    """
+    radius0, dradius, radial, az = _get_platescale_transform()['platescale']
+    return (_lerp(radius, radius0, dradius, radial),
+            _lerp(radius, radius0, dradius, az))
+
+#- focal plane transform modes; see FocalPlane
+_transforms = ('polynomial', 'platescale')
+
+def _transform_functions(transform):
+    """Returns (plate_dist, plate_angle, center_scale) functions of the
+    `transform` mode, where center_scale() is radius/angle in mm/radian
+    at the center of the focal plane.
+    """
+    if transform == 'polynomial':
+        return (_plate_dist, _plate_angle, lambda: _plate_dist_coeffs[2])
+    elif transform == 'platescale':
+        return (_platescale_dist, _platescale_angle,
+                lambda: _get_platescale_transform()['center_scale'])
+    else:
+        raise ValueError("transform must be one of {}, not {!r}".format(
+            ', '.join(_transforms), transform))
+
+_fiberpos = None
+def _get_fiberpos():
+    """Returns a cached read-only structured array copy of the fiberpos
+    table of :func:`desimodel.io.load_fiberpos`.
+
+    The copy is rebuilt if the fiberpos table cache is reloaded.
+    """
+    global _fiberpos
+    import desimodel.io
+    fiberpos = desimodel.io.load_fiberpos()
+    if _fiberpos is None or _fiberpos[0] is not fiberpos:
+        data = np.asarray(fiberpos.as_array())
+        data.flags.writeable = False
+        _fiberpos = (fiberpos, data)
+    return _fiberpos[1]
+
+_positioner_index = None
+def _get_positioner_index():
+    """Returns cached (tree, patrol_radius, max_radius, positioners, rows)
+    where tree is a KD-tree of the fiberpos X, Y positioner locations in mm,
+    patrol_radius is the positioner patrol radius in mm from desi.yaml,
+    max_radius is the largest focal plane radius a positioner reaches,
+    positioners are the positioner IDs and rows are the fiberpos row
+    numbers of the indexed positioners.
+
+    Only rows with DEVICE_TYPE 'POS' are indexed if fiberpos has that
+    column, skipping fiducials and other devices without a fiber.
+
+    The index is rebuilt if the fiberpos table cache is reloaded.
+    """
+    global _positioner_index
+    from scipy.spatial import cKDTree as KDTree
+    import desimodel.io
+    fiberpos = desimodel.io.load_fiberpos()
+    if _positioner_index is None or _positioner_index[0] is not fiberpos:
+        params = desimodel.io.load_desiparams()
+        patrol_radius = params['positioners']['radius_max']
+        if 'DEVICE_TYPE' in fiberpos.colnames:
+            device_type = np.char.strip(np.asarray(fiberpos['DEVICE_TYPE']).astype(str))
+            rows = np.where(device_type == 'POS')[0]
+        else:
+            rows = np.arange(len(fiberpos))
+        xy = np.array([fiberpos['X'][rows], fiberpos['Y'][rows]], dtype=float).T
+        max_radius = np.max(np.hypot(xy[:, 0], xy[:, 1])) + patrol_radius
+        _positioner_index = (fiberpos, KDTree(xy), patrol_radius, max_radius,
+                             np.asarray(fiberpos['POSITIONER'])[rows], rows)
+    return _positioner_index[1:]
+
 class FocalPlane(object):
     """A class for modeling the DESI focal plane and converting between
     focal plane coordinates (in mm) and RA, Dec on the sky (in degrees).
@@ -140,29 +336,36 @@ class FocalPlane(object):
     ra, dec : :class:`float`
         Initialize DESI focal plane model with the telescope pointing
         at (`ra`, `dec`) in degrees.
+    transform : {'polynomial', 'platescale'}
+        If 'polynomial', convert between angles on the sky and radii on
+        the focal plane with the cubic polynomial fit of :meth:`plate_dist`.
+        If 'platescale', use cached lookup tables interpolated from the
+        radius, angle and platescale columns of platescale.txt.
     """
 
-    def __init__(self, ra=0.0, dec=0.0):
+    def __init__(self, ra=0.0, dec=0.0, transform='polynomial'):
         """
         """
-        # Read $DESIMODEL/data/focalplane/fiberpos.fits and platescale.txt
-        # to construct focal plane model.  May also need data/desi.yaml .
+        # fiberpos.fits, platescale.txt and desi.yaml are only read when
+        # first needed, and are shared by all instances.
         self._check_radec(ra, dec)
         self.ra = ra
         self.dec = dec
-        self._fiberpos_file = os.path.join(os.environ['DESIMODEL'],
-                                           'data', 'focalplane',
-                                           'fiberpos.fits')
-        with fits.open(self._fiberpos_file) as hdulist:
-            self.fiberpos = hdulist[1].data
+        self._plate_dist, self._plate_angle, self._center_scale = \
+            _transform_functions(transform)
+        self.transform = transform
+
+    @property
+    def fiberpos(self):
+        """Read-only fiberpos table of :func:`desimodel.io.load_fiberpos`,
+        loaded on first access and shared by all instances.
+        """
+        return _get_fiberpos()
 
     def _check_radec(self, ra, dec):
         """Raise ValueError if RA or dec are out of bounds.
         """
-        if np.any( (ra < 0) | (ra >= 360) ):
-            raise ValueError("RA must be 0 <= RA < 360")
-        if np.any( (dec < -90) | (dec > +90) ):
-            raise ValueError("Dec must be -90 <= dec <= 90")
+        _check_radec(ra, dec)
 
     def set_tele_pointing(self, ra, dec):
         """Set telescope pointing to (RA, Dec) in degrees.
@@ -179,8 +382,9 @@ class FocalPlane(object):
 
     def plate_dist(self, theta):
         """Returns the radial distance on the plate (mm) given the angle
-        (radians). This is a fit to some data, it should be calculated on the
-        fly at __init__.
+        (radians). This is a fit to some data, or an interpolation of
+        platescale.txt if the FocalPlane was created with
+        ``transform='platescale'``.
 
         Parameters
         ----------
@@ -192,37 +396,28 @@ class FocalPlane(object):
         :class:`float`
             Radial distance in mm.
         """
-        p = np.array([8.297E5, -1750.0, 1.394E4, 0.0])
-        radius = 0.0
-        for i in range(4):
-            radius = theta*radius + p[i]
-        return radius
+        return self._plate_dist(theta)
 
     def plate_angle(self, radius):
         """Returns the angular distance on the plate (radians) given the
         radial distance to the plate (mm).
 
-        It uses a Newton-Raphson method.
+        It uses a Newton-Raphson method with the analytic derivative of
+        :meth:`plate_dist`; elements that have converged are not updated
+        further.  With ``transform='platescale'`` it interpolates the
+        inverse of the platescale.txt table instead.
 
         Parameters
         ----------
-        radius : :class:`float`
+        radius : :class:`float` or :class:`numpy.ndarray`
             Plate distance in mm.
 
         Returns
         -------
-        :class:`float`
+        :class:`float` or :class:`numpy.ndarray`
             Angular distance in radians.
         """
-        angle_guess = 0.0 * radius
-        dist_guess = self.plate_dist(angle_guess) - radius
-        while np.any(np.fabs(dist_guess) > 1E-8):
-            derivative = (self.plate_dist(angle_guess+1E-5) -
-                          self.plate_dist(angle_guess))/1E-5
-            delta_guess = - dist_guess/derivative
-            angle_guess = angle_guess + delta_guess
-            dist_guess = self.plate_dist(angle_guess) - radius
-        return angle_guess
+        return self._plate_angle(radius)
 
     def radec2xy(self, ra, dec):
         """Convert (RA, Dec) in degrees to (x, y) in mm on the focal plane
@@ -273,11 +468,20 @@ class FocalPlane(object):
         nn_hat0 = n_hat0
         nn_hat1 = costheta*n_hat1 - sintheta*n_hat2
         nn_hat2 = sintheta*n_hat1 + costheta*n_hat2
-        # Now find the radius on the plate
+        # Now find the radius on the plate; radius/theta tends to the
+        # linear plate_dist coefficient at the center.  theta is the sine
+        # of the angle from the pointing, while the platescale.txt table
+        # is indexed by the angle itself.
         theta = np.sqrt(nn_hat0*nn_hat0 + nn_hat1*nn_hat1)
-        radius = self.plate_dist(theta)
-        x = radius * nn_hat0/theta
-        y = radius * nn_hat1/theta
+        if self.transform == 'platescale':
+            radius = self.plate_dist(np.arcsin(np.minimum(theta, 1.0)))
+        else:
+            radius = self.plate_dist(theta)
+        scale = np.where(theta > 0,
+                         radius/np.where(theta > 0, theta, 1.0),
+                         self._center_scale())
+        x = scale * nn_hat0
+        y = scale * nn_hat1
         return (x, y)
 
     def xy2radec(self, x, y):
@@ -285,12 +489,14 @@ class FocalPlane(object):
         in degrees on the sky given the current telescope pointing towards
         (RA, Dec).
 
-        `x`, `y` must be floats. This function is vectorized in xy2radec(),
-        which doesn't appear to exist.
+        If `x`, `y` are floats, returns a tuple (ra, dec) of floats.
+        If `x`, `y` are numpy arrays, returns a tuple (ra, dec) of numpy
+        arrays; the telescope pointing may also be an array of the same
+        shape.
 
         Parameters
         ----------
-        x, y : :class:`float`
+        x, y : :class:`float` or :class:`numpy.ndarray`
             Position on the focal plane in mm.
 
         Returns
@@ -317,11 +523,16 @@ class FocalPlane(object):
         sinphi = t_hat1/sintheta
         # Find the initial position of the object vector when the tile
         # starts parallel to z_hat.
-        radius = np.sqrt(x*x + y*y)
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        radius = np.hypot(x, y)
         object_theta = self.plate_angle(radius)
-        object_phi = np.arctan2(y, x)
-        o_hat0 = np.sin(object_theta)*np.cos(object_phi)
-        o_hat1 = np.sin(object_theta)*np.sin(object_phi)
+        # cos and sin of the azimuth are x/radius and y/radius, and the
+        # azimuth is arbitrary at the center.
+        inv_radius = 1.0/np.where(radius > 0, radius, 1.0)
+        sin_object_theta = np.sin(object_theta)
+        o_hat0 = np.where(radius > 0, sin_object_theta*x*inv_radius, sin_object_theta)
+        o_hat1 = sin_object_theta*y*inv_radius
         o_hat2 = np.cos(object_theta)
         # First rotation, around x by an angle -theta.
         n_hat0 = o_hat0
@@ -334,7 +545,7 @@ class FocalPlane(object):
         nn_hat1 = -cosphi*n_hat0 + sinphi*n_hat1
         nn_hat2 = n_hat2
         # Convert from unit vectors to ra, dec.
-        object_theta = np.arccos(nn_hat2)
+        object_theta = np.arccos(np.clip(nn_hat2, -1.0, 1.0))
         object_phi = np.arctan2(nn_hat1, nn_hat0)
         object_dec = 90.0 - (180.0/np.pi)*object_theta
         # Due to rounding imprecisions the remainder has to be taken
@@ -342,9 +553,37 @@ class FocalPlane(object):
         object_ra = np.remainder((object_phi*180.0/np.pi), 360.0)
         object_ra = np.remainder(object_ra, 360.0)
         self._check_radec(object_ra, object_dec)
+        if object_ra.ndim == 0:
+            return (float(object_ra), float(object_dec))
         return (object_ra, object_dec)
 
-    def radec2pos(self, ra, dec):
+    def _positioner_pairs(self, ra, dec):
+        """Returns (itarget, ipositioner) index arrays of every target and
+        positioner row of fiberpos such that the target is within the
+        positioner patrol radius, for the current telescope pointing.
+        """
+        from scipy.spatial import cKDTree as KDTree
+        tree, patrol_radius, max_radius = _get_positioner_index()[0:3]
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        self._check_radec(ra, dec)
+
+        # Only targets in front of the focal plane whose sine of the angle
+        # to the pointing maps within max_radius can be covered; see radec2xy.
+        ra0, dec0 = np.radians(self.ra), np.radians(self.dec)
+        cosdist = (np.sin(np.radians(dec))*np.sin(dec0) +
+                   np.cos(np.radians(dec))*np.cos(dec0)*np.cos(np.radians(ra) - ra0))
+        maxsin = 1.01*self.plate_angle(max_radius)
+        itarget = np.where((cosdist > 0) & (1 - cosdist**2 <= maxsin**2))[0]
+        if len(itarget) == 0:
+            return itarget, np.zeros(0, dtype=np.int64)
+
+        x, y = self.radec2xy(ra[itarget], dec[itarget])
+        pairs = KDTree(np.array([x, y]).T).sparse_distance_matrix(
+            tree, patrol_radius, output_type='ndarray')
+        return itarget[pairs['i']], pairs['j']
+
+    def radec2pos(self, ra, dec, output='list'):
         """Identify which positioners cover (`ra`, `dec`).
 
         If `ra`, `dec` are floats, return an array of positioner IDs that
@@ -355,16 +594,268 @@ class FocalPlane(object):
         The ith element is an array of positioner IDs that cover
         (ra[i], dec[i]).
 
-        .. warning:: This method is not implemented!
+        A target is covered by a positioner if its focal plane position is
+        within the positioner patrol radius ``positioners: radius_max`` of
+        desi.yaml from the positioner X, Y in fiberpos.  The positioner
+        locations are indexed once with a cached KD-tree.
+
+        Parameters
+        ----------
+        ra, dec : :class:`float` or :class:`numpy.ndarray`
+            Sky positions in degrees.
+        output : {'list', 'csr'}
+            If 'csr', return a tuple (offsets, positioners, counts) of flat
+            arrays instead, where positioners[offsets[i]:offsets[i+1]] are
+            the sorted positioner IDs covering target i and counts[i] is
+            their number.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`, :class:`list` or :func:`tuple`
+            Positioner IDs covering each target.
         """
-        raise NotImplementedError
+        from .footprint import _check_output, _pairs_to_csr
+        _check_output(output)
+        positioners = _get_positioner_index()[3]
+        itarget, ipos = self._positioner_pairs(ra, dec)
+        offsets, ipos, counts = _pairs_to_csr(
+            itarget, positioners[ipos], np.size(ra))
+        if output == 'csr':
+            return offsets, ipos, counts
+        if np.isscalar(ra):
+            return ipos
+        if len(counts) == 0:
+            return []
+        return np.split(ipos, offsets[1:-1])
+
+    def pos2targets(self, ra, dec, output='list'):
+        """Identify which targets each positioner covers.
+
+        This is the inverse mapping of :meth:`radec2pos`: it returns one
+        element per positioner, in the order of the rows of
+        :func:`desimodel.io.load_fiberpos`, giving the indices of the
+        (`ra`, `dec`) arrays that the positioner covers.  Rows that are
+        not positioners, e.g. fiducials, cover no targets.
+
+        Parameters
+        ----------
+        ra, dec : :class:`numpy.ndarray`
+            Sky positions in degrees.
+        output : {'list', 'csr'}
+            If 'csr', return a tuple (offsets, targets, counts) of flat
+            arrays instead, where targets[offsets[i]:offsets[i+1]] are the
+            sorted target indices covered by positioner i.
+
+        Returns
+        -------
+        :class:`list` or :func:`tuple`
+            Target indices covered by each positioner.
+        """
+        from .footprint import _check_output, _pairs_to_csr
+        _check_output(output)
+        rows = _get_positioner_index()[4]
+        itarget, ipos = self._positioner_pairs(ra, dec)
+        offsets, itarget, counts = _pairs_to_csr(
+            rows[ipos], itarget, len(self.fiberpos))
+        if output == 'csr':
+            return offsets, itarget, counts
+        if len(counts) == 0:
+            return []
+        return np.split(itarget, offsets[1:-1])
+
+
+def _tile_rotations(tile_ra, tile_dec, eps):
+    """Return rotation matrices taking each tile center to the z axis.
+
+    This is the rotation of :meth:`FocalPlane.radec2xy`, a rotation around
+    z by pi/2 - phi followed by a rotation around x by theta, where theta
+    and phi describe the tile center.  `eps` is the small offset that
+    :meth:`FocalPlane.radec2xy` and :meth:`FocalPlane.xy2radec` add to
+    sin(theta).
+
+    Returns an array of shape (ntile, 3, 3).
+    """
+    tile_theta = np.radians(90.0 - np.asarray(tile_dec, dtype=float))
+    tile_phi = np.radians(np.asarray(tile_ra, dtype=float))
+    costheta = np.cos(tile_theta)
+    sintheta = np.sqrt(1.0 - costheta*costheta) + eps
+    cosphi = np.sin(tile_theta)*np.cos(tile_phi)/sintheta
+    sinphi = np.sin(tile_theta)*np.sin(tile_phi)/sintheta
+    rot = np.zeros((len(costheta), 3, 3))
+    rot[:, 0, 0] = sinphi
+    rot[:, 0, 1] = -cosphi
+    rot[:, 1, 0] = costheta*cosphi
+    rot[:, 1, 1] = costheta*sinphi
+    rot[:, 1, 2] = -sintheta
+    rot[:, 2, 0] = sintheta*cosphi
+    rot[:, 2, 1] = sintheta*sinphi
+    rot[:, 2, 2] = costheta
+    return rot
+
+
+def _ragged_csr(arrays):
+    """Return flat (values, offsets) for a list of arrays, one per tile."""
+    counts = [len(a) for a in arrays]
+    offsets = np.zeros(len(counts)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    if offsets[-1] > 0:
+        values = np.concatenate([np.asarray(a) for a in arrays])
+    else:
+        values = np.zeros(0)
+    return values, offsets
+
+
+def _check_tile_offsets(offsets, n, ntile):
+    """Return CSR `offsets` of `n` values over `ntile` tiles as an array,
+    raising ValueError if they do not match.
+    """
+    offsets = np.asarray(offsets)
+    if (offsets.ndim != 1 or len(offsets) != ntile + 1 or
+            offsets[0] != 0 or offsets[-1] != n):
+        raise ValueError("offsets do not describe {} values over {} tiles; "
+                         "expected a CSR tuple (offsets, indices[, counts])".format(
+                             n, ntile))
+    return offsets
+
 
+def radec2xy_tiles(tile_ra, tile_dec, ra, dec, targets, chunksize=1000000,
+                   transform='polynomial'):
+    """Convert (RA, Dec) to focal plane (x, y) for many tile pointings.
 
-# Not sure what to call it, but it would also be useful to have a
-# function that takes (ra, dec) arrays and returns a list with one
-# element per positioner, giving the indices of the (ra,dec) arrays
-# that that positioner covers.
-#
-# ditto for xy2pos(), xy2fiber(), etc.
+    This is equivalent to calling :meth:`FocalPlane.set_tele_pointing`
+    and :meth:`FocalPlane.radec2xy` for every tile, but converts all
+    targets in vectorized chunks using one precomputed rotation matrix
+    per tile.
+
+    Parameters
+    ----------
+    tile_ra, tile_dec : :class:`numpy.ndarray`
+        Tile centers in degrees.
+    ra, dec : :class:`numpy.ndarray`
+        Target positions in degrees.
+    targets : :func:`tuple` or :class:`list`
+        Indices into `ra`, `dec` of the targets of each tile, either as a
+        CSR tuple (offsets, indices[, counts]) such that
+        indices[offsets[i]:offsets[i+1]] are the targets of tile i, e.g.
+        from ``desimodel.footprint.find_points_in_tiles(..., output='csr')``;
+        or as a list of index arrays, one per tile, e.g. from
+        ``find_points_in_tiles(..., output='list')``.
+    chunksize : :class:`int`, optional
+        Number of (tile, target) pairs to convert at a time.
+    transform : {'polynomial', 'platescale'}, optional
+        Focal plane radius transform; see :class:`FocalPlane`.
+
+    Returns
+    -------
+    :func:`tuple`
+        Flat arrays (x, y) in mm aligned with the flattened target
+        indices, so that x[offsets[i]:offsets[i+1]] are the positions of
+        the targets of tile i on its focal plane.
+    """
+    plate_dist = _transform_functions(transform)[0]
+    if isinstance(targets, tuple):
+        indices = np.asarray(targets[1])
+        offsets = _check_tile_offsets(targets[0], len(indices), np.size(tile_ra))
+    else:
+        indices, offsets = _ragged_csr(targets)
+        offsets = _check_tile_offsets(offsets, len(indices), np.size(tile_ra))
+    indices = indices.astype(np.int64)
+    ra = np.asarray(ra, dtype=float)
+    dec = np.asarray(dec, dtype=float)
+    _check_radec(tile_ra, tile_dec)
+    _check_radec(ra, dec)
+    rot = _tile_rotations(tile_ra, tile_dec, 1E-12)
+    n = len(indices)
+    x = np.empty(n)
+    y = np.empty(n)
+    for i in range(0, n, chunksize):
+        j = min(i + chunksize, n)
+        tile = np.searchsorted(offsets, np.arange(i, j), side='right') - 1
+        target = indices[i:j]
+        object_theta = np.radians(90.0 - dec[target])
+        object_phi = np.radians(ra[target])
+        o_hat = np.array([np.sin(object_theta)*np.cos(object_phi),
+                          np.sin(object_theta)*np.sin(object_phi),
+                          np.cos(object_theta)]).T
+        nn_hat = np.einsum('nij,nj->ni', rot[tile], o_hat)
+        # Now find the radius on the plate as in FocalPlane.radec2xy.
+        theta = np.sqrt(nn_hat[:, 0]**2 + nn_hat[:, 1]**2)
+        if transform == 'platescale':
+            radius = plate_dist(np.arcsin(np.minimum(theta, 1.0)))
+        else:
+            radius = plate_dist(theta)
+        x[i:j] = radius * nn_hat[:, 0]/theta
+        y[i:j] = radius * nn_hat[:, 1]/theta
+    return (x, y)
+
+
+def xy2radec_tiles(tile_ra, tile_dec, x, y, offsets=None, chunksize=1000000,
+                   transform='polynomial'):
+    """Convert focal plane (x, y) to (RA, Dec) for many tile pointings.
+
+    This is equivalent to calling :meth:`FocalPlane.set_tele_pointing`
+    and :meth:`FocalPlane.xy2radec` for every tile, but converts all
+    positions in vectorized chunks using one precomputed rotation matrix
+    per tile.
+
+    Parameters
+    ----------
+    tile_ra, tile_dec : :class:`numpy.ndarray`
+        Tile centers in degrees.
+    x, y : :class:`numpy.ndarray` or :class:`list`
+        Focal plane positions in mm, either as flat arrays with `offsets`
+        such that x[offsets[i]:offsets[i+1]] are on tile i; or, if
+        `offsets` is None, lists of arrays, one per tile.
+    offsets : :class:`numpy.ndarray` or :func:`tuple`, optional
+        CSR offsets of the positions of each tile, or a CSR tuple
+        (offsets, indices[, counts]) as passed to :func:`radec2xy_tiles`,
+        of which only the offsets are used.
+    chunksize : :class:`int`, optional
+        Number of positions to convert at a time.
+    transform : {'polynomial', 'platescale'}, optional
+        Focal plane radius transform; see :class:`FocalPlane`.
+
+    Returns
+    -------
+    :func:`tuple`
+        Flat arrays (ra, dec) in degrees aligned with the flattened `x`, `y`.
+    """
+    plate_angle = _transform_functions(transform)[1]
+    if offsets is None:
+        x, offsets = _ragged_csr(x)
+        y = _ragged_csr(y)[0]
+    elif isinstance(offsets, tuple):
+        offsets = offsets[0]
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    offsets = _check_tile_offsets(offsets, len(x), np.size(tile_ra))
+    _check_radec(tile_ra, tile_dec)
+    # xy2radec applies the transpose of the radec2xy rotation.
+    rot = _tile_rotations(tile_ra, tile_dec, 1E-10)
+    n = len(x)
+    ra = np.empty(n)
+    dec = np.empty(n)
+    for i in range(0, n, chunksize):
+        j = min(i + chunksize, n)
+        tile = np.searchsorted(offsets, np.arange(i, j), side='right') - 1
+        radius = np.hypot(x[i:j], y[i:j])
+        object_theta = plate_angle(radius)
+        inv_radius = 1.0/np.where(radius > 0, radius, 1.0)
+        sin_object_theta = np.sin(object_theta)
+        o_hat = np.array([
+            np.where(radius > 0, sin_object_theta*x[i:j]*inv_radius,
+                     sin_object_theta),
+            sin_object_theta*y[i:j]*inv_radius,
+            np.cos(object_theta)]).T
+        nn_hat = np.einsum('nji,nj->ni', rot[tile], o_hat)
+        object_theta = np.arccos(np.clip(nn_hat[:, 2], -1.0, 1.0))
+        object_phi = np.arctan2(nn_hat[:, 1], nn_hat[:, 0])
+        dec[i:j] = 90.0 - np.degrees(object_theta)
+        ra[i:j] = np.remainder(np.remainder(np.degrees(object_phi), 360.0), 360.0)
+    _check_radec(ra, dec)
+    return (ra, dec)
+
+
+# It would also be useful to have xy2pos(), xy2fiber(), etc.
 # positioner = thing on the focal plane
 # fiber = numerically increasing in order on the spectrograph CCDs
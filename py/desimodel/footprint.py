@@ -1,9 +1,52 @@
 #- Utility functions for working with the DESI footprint
 
+import os
+from collections import OrderedDict
 import numpy as np
 from . import focalplane
 from . import io
 
+class _LRUCache(object):
+    """Dict-like cache of derived products that keeps only the `maxsize`
+    most recently used entries, so that caches keyed on tile content do
+    not grow without limit when called with many tile subsets.
+    """
+    def __init__(self, maxsize=8):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, key):
+        value = self._data.pop(key)
+        self._data[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+def clear_caches():
+    """Clears the in-memory caches of tile indices, pixel coverage,
+    footprint masks and pixel weights.
+
+    Each cache keeps the most recently used entries for a few tile sets;
+    this frees them, e.g. after processing a large tile subset.  Files in
+    $DESIMODEL_CACHE are not removed.
+    """
+    for cache in (_tile_tree, _tile_index, _tiles2pix_cache, _pix2tiles_index,
+                  _tile_overlap_graph, _footprint_mask, _pixweight):
+        cache.clear()
+
 def radec2pix(nside, ra, dec):
     '''Convert ra,dec to nested pixel number
 
@@ -22,7 +65,7 @@ def radec2pix(nside, ra, dec):
     theta, phi = np.radians(90-dec), np.radians(ra)
     return hp.ang2pix(nside, theta, phi, nest=True)
 
-def tiles2pix(nside, tiles=None, radius=None, per_tile=False):
+def tiles2pix(nside, tiles=None, radius=None, per_tile=False, nproc=1):
     '''
     Returns sorted array of pixels that overlap the tiles
 
@@ -38,13 +81,16 @@ def tiles2pix(nside, tiles=None, radius=None, per_tile=False):
         radius: tile radius in degrees;
             if None use desimodel.focalplane.get_tile_radius_deg()
         per_tile: if True, return a list of arrays of pixels per tile
+        nproc: number of processes used to query the tile discs
+
+    The per-tile coverage is cached by nside, radius and tile content;
+    set $DESIMODEL_CACHE to also cache it on disk across jobs.
 
     Returns pixels:
         integer array of pixel numbers that cover these tiles; or
         if per_tile is True, returns list of arrays such that pixels[i]
             is an array of pixel numbers covering tiles[i]
     '''
-    import healpy as hp
     if tiles is None:
         import desimodel.io
         tiles = desimodel.io.load_tiles()
@@ -53,24 +99,149 @@ def tiles2pix(nside, tiles=None, radius=None, per_tile=False):
         import desimodel.focalplane
         radius = desimodel.focalplane.get_tile_radius_deg()
 
-    theta, phi = np.radians(90-tiles['DEC']), np.radians(tiles['RA'])
-    vec = hp.ang2vec(theta, phi)
-    ipix = [hp.query_disc(nside, vec[i], radius=np.radians(radius),
-                inclusive=True, nest=True) for i in range(len(tiles))]
+    offsets, pixels = _tiles2pix_csr(nside, tiles, radius, nproc=nproc)
     if per_tile:
-        return ipix
+        #- copies, since the cached pixels are shared and read-only
+        return [np.array(p) for p in np.split(pixels, offsets[1:-1])]
+    else:
+        return np.unique(pixels)
+
+def _query_discs(args):
+    """ worker: concatenated query_disc pixels and counts for a batch of tiles """
+    import healpy as hp
+    nside, vec, radius = args
+    ipix = [hp.query_disc(nside, v, radius=radius, inclusive=True, nest=True)
+            for v in vec]
+    counts = np.array([len(x) for x in ipix], dtype=np.int64)
+    if len(ipix) > 0:
+        pixels = np.concatenate(ipix).astype(np.int64)
     else:
-        return np.sort(np.unique(np.concatenate(ipix)))
+        pixels = np.zeros(0, dtype=np.int64)
+    return counts, pixels
+
+_tiles2pix_cache = _LRUCache()
+def _tiles2pix_csr(nside, tiles, radius, nproc=1, batchsize=256):
+    """Returns (offsets, pixels) such that pixels[offsets[i]:offsets[i+1]]
+    are the sorted nested pixels covering tiles[i].
+
+    Tiles are processed in batches of `batchsize` spread over `nproc`
+    worker processes.  Results are cached in memory, and on disk in
+    $DESIMODEL_CACHE if set, keyed on nside, radius and the tile content;
+    disk cached results are memory-mapped.
+    """
+    import hashlib
+    import healpy as hp
+    global _tiles2pix_cache
+
+    key = hashlib.md5('{}-{!r}-{}'.format(
+        nside, float(radius), _tiles_hash(tiles)).encode()).hexdigest()
+    cachename = 'tiles2pix-{}'.format(key)
+    if key in _tiles2pix_cache:
+        return _tiles2pix_cache[key]
+
+    cached = io.load_cache(cachename, ['offsets', 'pixels'])
+    if cached is not None:
+        _tiles2pix_cache[key] = (cached['offsets'], cached['pixels'])
+        return _tiles2pix_cache[key]
+
+    theta, phi = np.radians(90-tiles['DEC']), np.radians(tiles['RA'])
+    vec = np.atleast_2d(hp.ang2vec(theta, phi))
+    batches = [(nside, vec[i:i+batchsize], np.radians(radius))
+               for i in range(0, len(vec), batchsize)]
+    if nproc > 1 and len(batches) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(_query_discs, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_query_discs(b) for b in batches]
+
+    offsets = np.zeros(len(vec)+1, dtype=np.int64)
+    if len(results) > 0:
+        offsets[1:] = np.cumsum(np.concatenate([r[0] for r in results]))
+        pixels = np.concatenate([r[1] for r in results])
+    else:
+        pixels = np.zeros(0, dtype=np.int64)
+
+    io.write_cache(cachename, dict(offsets=offsets, pixels=pixels))
+    #- results are shared between callers, so protect them like the mmaps
+    offsets.setflags(write=False)
+    pixels.setflags(write=False)
+    _tiles2pix_cache[key] = (offsets, pixels)
+    return offsets, pixels
+
+def _csr_gather(offsets, indices, rows):
+    """Returns the concatenation of indices[offsets[r]:offsets[r+1]]
+    for every r in rows, without a Python loop.
+    """
+    starts = offsets[rows]
+    counts = offsets[np.asarray(rows)+1] - starts
+    n = np.sum(counts)
+    if n == 0:
+        return indices[:0]
+    #- position within each row, then shift by the row start
+    within = np.arange(n) - np.repeat(np.cumsum(counts) - counts, counts)
+    return indices[np.repeat(starts, counts) + within]
+
+_pix2tiles_index = _LRUCache()
+def get_pix2tiles_index(nside, tiles=None, radius=None, nproc=1):
+    """Returns a cached sparse pixel -> tile inverted index.
+
+    The index is built once per (nside, tile set, radius) from the same
+    pixel coverage as :func:`tiles2pix`.
+
+    Args:
+        nside: integer healpix nside, 2**k with 1 <= k <= 30
+
+    Optional:
+        tiles:
+            Table-like with RA,DEC columns; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+        nproc: number of processes used to build the tile coverage
+
+    Returns tuple (pixels, offsets, tileindices):
+        pixels is the sorted array of nested pixels covered by any tile,
+        and tileindices[offsets[i]:offsets[i+1]] are the sorted indices
+        into `tiles` of the tiles covering pixels[i].  The arrays are
+        shared between callers and read-only.
+    """
+    global _pix2tiles_index
+    if tiles is None:
+        tiles = io.load_tiles()
+
+    if radius is None:
+        radius = focalplane.get_tile_radius_deg()
+
+    key = (nside, _tiles_hash(tiles), float(radius))
+    if key not in _pix2tiles_index:
+        tileoffsets, tilepix = _tiles2pix_csr(nside, tiles, radius, nproc=nproc)
+        owner = np.repeat(np.arange(len(tileoffsets)-1), np.diff(tileoffsets))
+        #- sort by pixel, then by tile within each pixel
+        order = np.lexsort((owner, tilepix))
+        tilepix = tilepix[order]
+        owner = owner[order]
+        pixels, first = np.unique(tilepix, return_index=True)
+        offsets = np.append(first, len(tilepix)).astype(np.int64)
+        #- results are shared between callers, so protect them
+        for x in (pixels, offsets, owner):
+            x.setflags(write=False)
+        _pix2tiles_index[key] = (pixels, offsets, owner)
+
+    return _pix2tiles_index[key]
 
 def tileids2pix(nside, tileids, radius=None, per_tile=False):
     '''
     Like tiles2pix, but accept integer tileid or list of tileids instead
     of table of tiles
     '''
-    import desimodel.io
-    tiles = desimodel.io.load_tiles()
-    ii = np.in1d(tiles['TILEID'], tileids)
-    if np.count_nonzero(ii) > 0:
+    rows, found, tiles = _tileid_rows(np.atleast_1d(tileids))
+    if np.count_nonzero(found) > 0:
+        ii = np.unique(rows[found])
         return tiles2pix(nside, tiles[ii], radius=radius, per_tile=per_tile)
     else:
         raise ValueError('TILEID(s) {} not in DESI footprint'.format(tileids))
@@ -96,9 +267,6 @@ def pix2tiles(nside, pixels, tiles=None, radius=None):
 
     TODO: add support for tiles as integers or list/array of integer TILEIDs
     '''
-    import healpy as hp
-    import desimodel.footprint
-
     if tiles is None:
         import desimodel.io
         tiles = desimodel.io.load_tiles()
@@ -107,27 +275,64 @@ def pix2tiles(nside, pixels, tiles=None, radius=None):
         import desimodel.focalplane
         radius = desimodel.focalplane.get_tile_radius_deg()
 
-    #- Trim tiles to ones that *might* overlap these pixels
-    theta, phi = hp.pix2ang(nside, pixels, nest=True)
-    ra, dec = np.degrees(phi), 90 - np.degrees(theta)
-    pixsize = np.degrees(hp.nside2resol(nside))
-    ii = desimodel.footprint.find_tiles_over_point(tiles, ra, dec, radius=radius+pixsize)
-    if np.isscalar(pixels):
-        tiles = tiles[ii]
+    #- Look up the pixels in the cached pixel -> tile index
+    indexpix, offsets, tileindices = get_pix2tiles_index(nside, tiles, radius)
+    pixels = np.atleast_1d(pixels)
+    i = np.clip(np.searchsorted(indexpix, pixels), 0, max(len(indexpix)-1, 0))
+    if len(indexpix) > 0:
+        i = i[indexpix[i] == pixels]
     else:
-        ii = np.unique(np.concatenate(ii))
-        tiles = tiles[ii]
-
-    #- Now check in detail
-    theta, phi = np.radians(90-tiles['DEC']), np.radians(tiles['RA'])
-    vec = hp.ang2vec(theta, phi)
-    ii = list()
-    for i in range(len(tiles)):
-        tilepix = hp.query_disc(nside, vec[i], radius=np.radians(radius), inclusive=True, nest=True)
-        if np.any(np.in1d(pixels, tilepix)):
-            ii.append(i)
+        i = i[:0]
+    ii = np.unique(_csr_gather(offsets, tileindices, i))
     return tiles[ii]
 
+def depth_map(nside, weights=None, tiles=None, radius=None, nproc=1):
+    '''
+    Returns a HEALPix map of tile weights summed over the tiles overlapping
+    each pixel, e.g. the accumulated exposure time
+
+    Args:
+        nside: integer healpix nside, 2**k with 1 <= k <= 30
+
+    Optional:
+        weights:
+            None to count the tiles; or
+            name of a tiles column, e.g. 'EXPTIME'; or
+            array of per-tile weights with len(tiles)
+        tiles:
+            Table-like with RA,DEC columns; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+        nproc: number of processes used to build the tile coverage
+
+    Returns:
+        float array depth[npix] in nested pixel order
+
+    Pixels overlapping a tile are as in :func:`tiles2pix`, and the sum
+    uses the cached index of :func:`get_pix2tiles_index`.
+    '''
+    import healpy as hp
+    if tiles is None:
+        tiles = io.load_tiles()
+
+    if radius is None:
+        radius = focalplane.get_tile_radius_deg()
+
+    if weights is None:
+        weights = np.ones(len(tiles))
+    elif isinstance(weights, str):
+        weights = tiles[weights]
+    weights = np.asarray(weights, dtype=float)
+    if weights.shape != (len(tiles),):
+        raise ValueError('weights shape {} != ({},)'.format(weights.shape, len(tiles)))
+
+    pixels, offsets, tileindices = get_pix2tiles_index(nside, tiles, radius,
+                                                       nproc=nproc)
+    pixels = np.repeat(pixels, np.diff(offsets))
+    return np.bincount(pixels, weights=weights[tileindices],
+                       minlength=hp.nside2npix(nside))
+
 def _embed_sphere(ra, dec):
     """ embed RA DEC to a uniform sphere in three-d """
     phi = np.radians(np.asarray(ra))
@@ -138,13 +343,153 @@ def _embed_sphere(ra, dec):
     z = np.cos(theta)
     return np.array((x, y, z)).T
 
-def is_point_in_desi(tiles, ra, dec, radius=None, return_tile_index=False):
+def _radius2chord(radius):
+    """ convert an angular radius in degrees to a 3d (chord) distance """
+    return 2.0 * np.sin(np.radians(radius) * 0.5)
+
+def _tiles_hash(tiles):
+    """ return a hex digest identifying the RA,DEC content of tiles """
+    import hashlib
+    h = hashlib.md5()
+    h.update(np.ascontiguousarray(tiles['RA'], dtype='f8').tobytes())
+    h.update(np.ascontiguousarray(tiles['DEC'], dtype='f8').tobytes())
+    return h.hexdigest()
+
+_tile_tree = _LRUCache()
+def _get_tile_tree(tiles):
+    """Returns cached (xyz, tree) of the tile centers embedded on the unit
+    sphere and their KD-tree, keyed on the RA,DEC content of `tiles`.
+
+    The tree does not depend on the tile radius, so it is shared by every
+    :class:`TileIndex` and query radius of the same tiles.
+    """
+    from scipy.spatial import cKDTree as KDTree
+    global _tile_tree
+    if isinstance(tiles, TileIndex):
+        return tiles.xyz, tiles.tree
+    key = _tiles_hash(tiles)
+    if key not in _tile_tree:
+        xyz = _embed_sphere(tiles['RA'], tiles['DEC'])
+        _tile_tree[key] = (xyz, KDTree(np.atleast_2d(xyz)))
+    return _tile_tree[key]
+
+class TileIndex(object):
+    """A reusable spatial index of tile centers.
+
+    Embeds the tile centers on the unit sphere and builds a KD-tree once,
+    so that repeated footprint queries against the same tiles only pay
+    the query cost.  The KD-tree is shared by all indices of the same
+    tiles, whatever their radius.  Use :func:`get_tile_index` to get a
+    cached instance.
+
+    Parameters
+    ----------
+    tiles : Table-like, optional
+        Table with RA,DEC columns; if None use desimodel.io.load_tiles().
+    radius : :class:`float`, optional
+        Default tile radius in degrees for queries using this index;
+        if None use desimodel.focalplane.get_tile_radius_deg().
+    """
+
+    def __init__(self, tiles=None, radius=None):
+        if tiles is None:
+            tiles = io.load_tiles()
+
+        if radius is None:
+            radius = focalplane.get_tile_radius_deg()
+
+        self.tiles = tiles
+        self.radius = radius
+        self.xyz, self.tree = _get_tile_tree(tiles)
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def threshold(self, radius=None):
+        """Returns the 3d distance matching `radius` in degrees, defaulting
+        to the radius of this index.
+        """
+        if radius is None:
+            radius = self.radius
+        return _radius2chord(radius)
+
+_tile_index = _LRUCache()
+def get_tile_index(tiles=None, radius=None):
+    """Returns a cached :class:`TileIndex` for `tiles` and `radius`.
+
+    The cache is keyed on the RA,DEC content of the tiles and the radius,
+    so it is safe to call this with a freshly loaded or sliced table.
+    Indices of the same tiles with different radii share one KD-tree,
+    and only the most recently used indices are kept; see
+    :func:`clear_caches`.
+
+    Args:
+        tiles: Table-like with RA,DEC columns; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+
+    Returns:
+        :class:`TileIndex`
+    """
+    global _tile_index
+    if isinstance(tiles, TileIndex):
+        return tiles
+
+    if tiles is None:
+        tiles = io.load_tiles()
+
+    if radius is None:
+        radius = focalplane.get_tile_radius_deg()
+
+    key = (_tiles_hash(tiles), float(radius))
+    if key not in _tile_index:
+        _tile_index[key] = TileIndex(tiles, radius=radius)
+    return _tile_index[key]
+
+def _get_tile_xyz(tiles):
+    """ return embedded tile centers, reusing them from a TileIndex """
+    if isinstance(tiles, TileIndex):
+        return tiles.xyz
+    return _embed_sphere(tiles['RA'], tiles['DEC'])
+
+def _map_chunks(func, n, nproc=1, chunksize=None):
+    """Returns [func(i, j) for each slice i:j covering range(n)], computed
+    by `nproc` threads.  Results are in slice order regardless of nproc.
+
+    The cKDTree queries release the GIL, so threads scale without
+    copying the tile index or the input points into worker processes.
+    """
+    if chunksize is None:
+        chunksize = max(1, -(-n // max(nproc, 1)))
+    slices = [(i, min(i+chunksize, n)) for i in range(0, max(n, 1), chunksize)]
+    if nproc > 1 and len(slices) > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(nproc)
+        try:
+            return pool.map(lambda ij: func(*ij), slices)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        return [func(i, j) for i, j in slices]
+
+def _spatial_order(ra, dec, nside=8192):
+    """Returns the permutation sorting points by nested HEALPix pixel,
+    so that points near each other on the sky are near each other in memory.
+    """
+    return np.argsort(radec2pix(nside, ra, dec))
+
+def is_point_in_desi(tiles, ra, dec, radius=None, return_tile_index=False,
+                     nproc=1, spatial_sort=False):
     """Return if points given by ra, dec lie in the set of _tiles.
 
     This function is optimized to query a lot of points.
     radius is in units of degrees.
 
-    `tiles` is the result of load_tiles.
+    `tiles` is the result of load_tiles, or a :class:`TileIndex`
+    from :func:`get_tile_index`; tables are looked up in the cache
+    of :func:`get_tile_index` so the KD-tree is only built once.
 
     If a point is within `radius` distance from center of any tile,
     it is in desi.
@@ -154,19 +499,43 @@ def is_point_in_desi(tiles, ra, dec, radius=None, return_tile_index=False):
 
     If return_tile_index is True, return the index of the nearest tile in tiles array.
 
-    default radius is from desimodel.focalplane.get_tile_radius_deg()
-    """
-    from scipy.spatial import cKDTree as KDTree
+    If nproc > 1, array inputs are split across `nproc` threads;
+    the results are identical to nproc=1.
 
-    if radius is None:
-        radius = focalplane.get_tile_radius_deg()
+    If spatial_sort is True, array inputs are queried in nested HEALPix
+    order, which improves memory locality of the KD-tree queries for
+    large catalogs in random sky order; results are returned in the
+    original order.
 
-    tilecenters = _embed_sphere(tiles['RA'], tiles['DEC'])
-    tree = KDTree(tilecenters)
-    # radius to 3d distance
-    threshold = 2.0 * np.sin(np.radians(radius) * 0.5)
-    xyz = _embed_sphere(ra, dec)
-    d, i = tree.query(xyz, k=1)
+    default radius is from desimodel.focalplane.get_tile_radius_deg(),
+    or the radius of `tiles` if it is a :class:`TileIndex`.
+    """
+    index = get_tile_index(tiles, radius=radius)
+    if spatial_sort and not np.isscalar(ra):
+        ra, dec = np.asarray(ra), np.asarray(dec)
+        order = _spatial_order(ra, dec)
+        result = is_point_in_desi(index, ra[order], dec[order], radius=radius,
+                                  return_tile_index=return_tile_index,
+                                  nproc=nproc)
+        if return_tile_index:
+            indesi, i = np.empty_like(result[0]), np.empty_like(result[1])
+            indesi[order], i[order] = result
+            return indesi, i
+        indesi = np.empty_like(result)
+        indesi[order] = result
+        return indesi
+
+    threshold = index.threshold(radius)
+    if nproc > 1 and not np.isscalar(ra):
+        def query(i, j):
+            return index.tree.query(_embed_sphere(ra[i:j], dec[i:j]), k=1)
+        ra, dec = np.asarray(ra), np.asarray(dec)
+        results = _map_chunks(query, len(ra), nproc)
+        d = np.concatenate([r[0] for r in results])
+        i = np.concatenate([r[1] for r in results])
+    else:
+        xyz = _embed_sphere(ra, dec)
+        d, i = index.tree.query(xyz, k=1)
 
     indesi = d < threshold
     if return_tile_index:
@@ -174,34 +543,168 @@ def is_point_in_desi(tiles, ra, dec, radius=None, return_tile_index=False):
     else:
         return indesi
 
-def find_tiles_over_point(tiles, ra, dec, radius=None):
+def nearest_tiles(ra, dec, k=1, radii=None, tiles=None, nproc=1):
+    """Returns the k nearest tiles of each point with their separations.
+
+    Args:
+        ra, dec: arrays or scalars of coordinates in degrees
+
+    Optional:
+        k: number of nearest tiles per point
+        radii: list of radii in degrees to return membership masks for,
+            e.g. an inner patrol radius and the outer tile radius;
+            if None use [desimodel.focalplane.get_tile_radius_deg()],
+            or the radius of `tiles` if it is a :class:`TileIndex`
+        tiles: Table-like with RA,DEC columns; or a :class:`TileIndex`; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        nproc: number of threads to split the points over
+
+    Returns:
+        tuple (indices, separations, masks) where indices[i] are the
+        indices into tiles of the k nearest tiles of point i, ordered by
+        increasing great-circle separation separations[i] in degrees, and
+        masks[r, i] is ``separations[i] < radii[r]``.  For scalar ra, dec
+        the leading point dimension is dropped.  If there are fewer than
+        k tiles, missing neighbors have index len(tiles) and infinite
+        separation.
+
+    All radii are answered from a single query of the cached KD-tree of
+    the tile centers, which does not depend on the radius.
+    """
+    #- radii are applied as chord thresholds below, so only the default
+    #- radius needs the tile index; the KD-tree is shared across radii
+    if radii is None:
+        index = get_tile_index(tiles)
+        radii = np.array([index.radius], dtype=float)
+        tree = index.tree
+    else:
+        radii = np.atleast_1d(np.asarray(radii, dtype=float))
+        tree = _get_tile_tree(tiles if tiles is not None else io.load_tiles())[1]
+
+    scalar = np.isscalar(ra)
+    ra, dec = np.atleast_1d(ra), np.atleast_1d(dec)
+    def query(i, j):
+        d, t = tree.query(_embed_sphere(ra[i:j], dec[i:j]), k=k)
+        return d.reshape(j-i, k), t.reshape(j-i, k)
+    results = _map_chunks(query, len(ra), nproc)
+    d = np.concatenate([r[0] for r in results])
+    indices = np.concatenate([r[1] for r in results])
+
+    separations = np.full(d.shape, np.inf)
+    ii = np.isfinite(d)
+    separations[ii] = np.degrees(2*np.arcsin(np.minimum(d[ii]/2, 1)))
+    #- compare chord distances, consistent with is_point_in_desi
+    masks = d[None, :, :] < _radius2chord(radii)[:, None, None]
+    if scalar:
+        return indices[0], separations[0], masks[:, 0]
+    return indices, separations, masks
+
+def _query_pairs(tree, xyz, threshold):
+    """Returns (i, j, d) for every pair of xyz[i] and tree point j
+    within 3d distance `threshold` of each other, without building
+    Python lists.
+    """
+    from scipy.spatial import cKDTree as KDTree
+    xyz = np.atleast_2d(xyz)
+    pairs = KDTree(xyz).sparse_distance_matrix(tree, threshold,
+                                               output_type='ndarray')
+    return pairs['i'], pairs['j'], pairs['v']
+
+def _pairs_to_csr(rows, cols, nrows):
+    """Returns (offsets, indices, counts) for (row, col) pairs, such that
+    indices[offsets[r]:offsets[r+1]] are the sorted cols of row r.
+    """
+    order = np.lexsort((cols, rows))
+    counts = np.bincount(rows, minlength=nrows)
+    offsets = np.zeros(nrows+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return offsets, np.asarray(cols[order], dtype=np.int64), counts
+
+def _concatenate_csr(csr):
+    """Stacks a list of (offsets, indices, counts) along the rows"""
+    counts = np.concatenate([c[2] for c in csr])
+    indices = np.concatenate([c[1] for c in csr])
+    offsets = np.zeros(len(counts)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    return offsets, indices, counts
+
+def _check_output(output):
+    if output not in ('list', 'csr'):
+        raise ValueError("output must be 'list' or 'csr', not {!r}".format(output))
+
+def find_tiles_over_point(tiles, ra, dec, radius=None, output='list',
+                          chunksize=1000000, nproc=1, spatial_sort=False):
     """Return a list of indices of tiles that covers the points.
 
     This function is optimized to query a lot of points.
     radius is in units of degrees. The return value is an array
     of list objects that are the indices of tiles that cover each point.
 
+    `tiles` is the result of load_tiles, or a :class:`TileIndex`
+    from :func:`get_tile_index`.
+
     The indices are not sorted in any particular order.
 
     if ra, dec are scalars, a single list is returned.
 
-    default radius is from desimodel.focalplane.get_tile_radius_deg()
+    If output='csr', return a tuple (offsets, indices, counts) of flat
+    integer arrays instead, where indices[offsets[i]:offsets[i+1]] are the
+    sorted indices of the tiles covering point i and counts[i] is their
+    number.  Points are processed `chunksize` at a time.
+
+    If nproc > 1, array inputs are split across `nproc` threads;
+    the results are identical to nproc=1.
+
+    If spatial_sort is True, array inputs are queried in nested HEALPix
+    order as in :func:`is_point_in_desi`; results are returned in the
+    original order.
+
+    default radius is from desimodel.focalplane.get_tile_radius_deg(),
+    or the radius of `tiles` if it is a :class:`TileIndex`.
     """
-    from scipy.spatial import cKDTree as KDTree
+    _check_output(output)
+    index = get_tile_index(tiles, radius=radius)
+    if spatial_sort and not np.isscalar(ra):
+        ra, dec = np.asarray(ra), np.asarray(dec)
+        order = _spatial_order(ra, dec)
+        result = find_tiles_over_point(index, ra[order], dec[order],
+            radius=radius, output=output, chunksize=chunksize, nproc=nproc)
+        if output == 'csr':
+            #- sorted position of each original point
+            rows = np.empty_like(order)
+            rows[order] = np.arange(len(order))
+            offsets, indices, counts = result
+            counts = counts[rows]
+            indices = _csr_gather(offsets, indices, rows)
+            offsets = np.zeros(len(counts)+1, dtype=np.int64)
+            offsets[1:] = np.cumsum(counts)
+            return offsets, indices, counts
+        indices = np.empty(len(order), dtype=object)
+        indices[order] = result
+        return indices
 
-    if radius is None:
-        radius = focalplane.get_tile_radius_deg()
+    threshold = index.threshold(radius)
+    if output == 'csr':
+        def query(i, j):
+            xyz = _embed_sphere(ra[i:j], dec[i:j])
+            ipoint, itile, d = _query_pairs(index.tree, xyz, threshold)
+            return _pairs_to_csr(ipoint, itile, len(xyz))
+        ra, dec = np.atleast_1d(ra), np.atleast_1d(dec)
+        chunksize = min(chunksize, max(1, -(-len(ra) // max(nproc, 1))))
+        return _concatenate_csr(_map_chunks(query, len(ra), nproc, chunksize))
 
-    tilecenters = _embed_sphere(tiles['RA'], tiles['DEC'])
-    tree = KDTree(tilecenters)
+    if nproc > 1 and not np.isscalar(ra):
+        def query(i, j):
+            xyz = _embed_sphere(ra[i:j], dec[i:j])
+            return index.tree.query_ball_point(xyz, threshold)
+        ra, dec = np.asarray(ra), np.asarray(dec)
+        return np.concatenate(_map_chunks(query, len(ra), nproc))
 
-    # radius to 3d distance
-    threshold = 2.0 * np.sin(np.radians(radius) * 0.5)
     xyz = _embed_sphere(ra, dec)
-    indices = tree.query_ball_point(xyz, threshold)
+    indices = index.tree.query_ball_point(xyz, threshold)
     return indices
 
-def find_points_in_tiles(tiles, ra, dec, radius=None):
+def find_points_in_tiles(tiles, ra, dec, radius=None, output='list'):
     """Return a list of indices of points that are within each provided tile(s).
 
     This function is optimized to query a lot of points with relatively few tiles.
@@ -210,14 +713,26 @@ def find_points_in_tiles(tiles, ra, dec, radius=None):
     of lists that contains the index of points that are in each tile.
     The indices are not sorted in any particular order.
 
+    `tiles` may also be a :class:`TileIndex`, in which case the
+    embedded tile centers are reused.
+
     if tiles is a scalar, a single list is returned.
 
-    default radius is from desimodel.focalplane.get_tile_radius_deg()
+    If output='csr', return a tuple (offsets, indices, counts) of flat
+    integer arrays instead, where indices[offsets[i]:offsets[i+1]] are the
+    sorted indices of the points in tile i and counts[i] is their number.
+
+    default radius is from desimodel.focalplane.get_tile_radius_deg(),
+    or the radius of `tiles` if it is a :class:`TileIndex`.
     """
     from scipy.spatial import cKDTree as KDTree
 
+    _check_output(output)
     if radius is None:
-        radius = focalplane.get_tile_radius_deg()
+        if isinstance(tiles, TileIndex):
+            radius = tiles.radius
+        else:
+            radius = focalplane.get_tile_radius_deg()
 
     # check for malformed input shapes. Sorry we currently only
     # deal with vector inputs. (for a sensible definition of indices)
@@ -229,24 +744,734 @@ def find_points_in_tiles(tiles, ra, dec, radius=None):
     tree = KDTree(points)
 
     # radius to 3d distance
-    threshold = 2.0 * np.sin(np.radians(radius) * 0.5)
-    xyz = _embed_sphere(tiles['RA'], tiles['DEC'])
+    threshold = _radius2chord(radius)
+    xyz = _get_tile_xyz(tiles)
+    if output == 'csr':
+        itile, ipoint, d = _query_pairs(tree, xyz, threshold)
+        return _pairs_to_csr(itile, ipoint, len(np.atleast_2d(xyz)))
+
     indices = tree.query_ball_point(xyz, threshold)
     return indices
 
+_tile_overlap_graph = _LRUCache()
+def tile_overlap_graph(tiles=None, radius=None):
+    """Returns the sparse graph of tiles whose centers are within `radius`.
+
+    Args:
+        tiles: Table-like with RA,DEC columns, or :class:`TileIndex`; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: maximum separation of tile centers in degrees;
+            if None use twice desimodel.focalplane.get_tile_radius_deg(),
+            i.e. tiles that overlap
+
+    Returns:
+        tuple (offsets, indices, separations) of flat arrays, where
+        indices[offsets[i]:offsets[i+1]] are the sorted indices of the
+        tiles neighboring tile i (excluding i itself) and
+        separations[offsets[i]:offsets[i+1]] their separations in degrees.
+
+    The graph is built with a single KD-tree pair query and cached in
+    memory, and on disk in $DESIMODEL_CACHE if set, keyed on the tile
+    RA,DEC content and the radius.  The returned arrays are read-only.
+    """
+    import hashlib
+    global _tile_overlap_graph
+    if radius is None:
+        radius = 2 * focalplane.get_tile_radius_deg()
+
+    index = get_tile_index(tiles, radius=radius)
+    key = hashlib.md5('{!r}-{}'.format(float(radius),
+        _tiles_hash(index.tiles)).encode()).hexdigest()
+    if key in _tile_overlap_graph:
+        return _tile_overlap_graph[key]
+
+    keys = ['offsets', 'indices', 'separations']
+    cachename = 'tileoverlap-{}'.format(key)
+    cached = io.load_cache(cachename, keys)
+    if cached is None:
+        i, j, d = _query_pairs(index.tree, index.xyz, _radius2chord(radius))
+        ii = i != j
+        i, j, d = i[ii], j[ii], d[ii]
+        order = np.lexsort((j, i))
+        offsets = np.zeros(len(index)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(i, minlength=len(index)))
+        indices = np.asarray(j[order], dtype=np.int64)
+        separations = np.degrees(2*np.arcsin(np.minimum(d[order]/2, 1)))
+        io.write_cache(cachename, dict(offsets=offsets, indices=indices,
+                                       separations=separations))
+        for x in (offsets, indices, separations):
+            x.setflags(write=False)
+        graph = (offsets, indices, separations)
+    else:
+        graph = tuple([cached[k] for k in keys])
+
+    _tile_overlap_graph[key] = graph
+    return graph
+
+def iter_radec(ra, dec, chunksize=1000000):
+    """Yields (ra, dec) chunks of at most `chunksize` points.
+
+    ra, dec can be any sliceable arrays, e.g. numpy memmaps, so that
+    only one chunk at a time is read into memory.
+    """
+    for i in range(0, len(ra), chunksize):
+        yield np.asarray(ra[i:i+chunksize]), np.asarray(dec[i:i+chunksize])
+
+def iter_fits_radec(filename, chunksize=1000000, ext=1, rows=None,
+                    racol='RA', deccol='DEC'):
+    """Yields (ra, dec) chunks read from a FITS binary table.
+
+    The file is memory-mapped so only the rows of the current chunk
+    are read.
+
+    Args:
+        filename: FITS file with RA,DEC columns
+
+    Optional:
+        chunksize: maximum number of rows per chunk
+        ext: HDU number or name of the table
+        rows: (start, stop) range of rows to read; default all rows
+        racol, deccol: names of the RA and Dec columns
+    """
+    from astropy.io import fits
+    with fits.open(filename, memmap=True) as hdulist:
+        data = hdulist[ext].data
+        if rows is None:
+            start, stop = 0, len(data)
+        else:
+            start, stop = rows[0], min(rows[1], len(data))
+        for i in range(start, stop, chunksize):
+            chunk = data[i:min(i+chunksize, stop)]
+            yield np.array(chunk[racol]), np.array(chunk[deccol])
+
+def iter_is_point_in_desi(tiles, radec_chunks, radius=None,
+                          return_tile_index=False, nproc=1):
+    """Yields :func:`is_point_in_desi` results for each (ra, dec) chunk.
+
+    Streaming variant of :func:`is_point_in_desi` for catalogs that do
+    not fit in memory, e.g. with chunks from :func:`iter_radec` or
+    :func:`iter_fits_radec`.  The tile index is built once and reused,
+    so the working set is bounded by the chunk size.
+    """
+    index = get_tile_index(tiles, radius=radius)
+    for ra, dec in radec_chunks:
+        yield is_point_in_desi(index, ra, dec, radius=radius,
+                               return_tile_index=return_tile_index,
+                               nproc=nproc)
+
+def iter_find_tiles_over_point(tiles, radec_chunks, radius=None,
+                               output='list', nproc=1):
+    """Yields :func:`find_tiles_over_point` results for each (ra, dec) chunk.
+
+    Streaming variant of :func:`find_tiles_over_point`; see
+    :func:`iter_is_point_in_desi`.  Indices refer to positions within
+    each chunk.
+    """
+    _check_output(output)
+    index = get_tile_index(tiles, radius=radius)
+    for ra, dec in radec_chunks:
+        yield find_tiles_over_point(index, ra, dec, radius=radius,
+                                    output=output, nproc=nproc)
+
+def _tile_groups(tiles, by):
+    """Returns (values, group) for tiles column `by`, such that tile i
+    belongs to group[i] with value values[group[i]].
+    """
+    if isinstance(tiles, TileIndex):
+        tiles = tiles.tiles
+    elif tiles is None:
+        tiles = io.load_tiles()
+    if by is None:
+        return None, np.zeros(len(np.atleast_1d(tiles['RA'])), dtype=np.int64)
+    values, group = np.unique(np.atleast_1d(tiles[by]), return_inverse=True)
+    return values, group
+
+def _coverage_counts(tiles, index, xyzfunc, n, by, threshold, nproc, chunksize):
+    """Counts tiles within threshold of the n points xyzfunc(i, j)
+    returns for each slice i:j, split by tiles column `by`.
+    """
+    values, group = _tile_groups(tiles, by)
+    ngroup = 1 if values is None else len(values)
+
+    def count(i, j):
+        ipoint, itile, d = _query_pairs(index.tree, xyzfunc(i, j), threshold)
+        counts = np.bincount(ipoint*ngroup + group[itile],
+                             minlength=(j-i)*ngroup)
+        return counts.astype(np.int32).reshape(j-i, ngroup)
+
+    counts = np.concatenate(_map_chunks(count, n, nproc, chunksize))
+    if values is None:
+        return counts[:, 0]
+    else:
+        return values, counts
+
+def tile_coverage_counts(ra, dec, tiles=None, radius=None, by=None, nproc=1,
+                         chunksize=1000000):
+    """Returns the number of tiles covering each (ra, dec) point.
+
+    Args:
+        ra, dec: arrays of coordinates in degrees
+
+    Optional:
+        tiles: Table-like with RA,DEC columns; or a :class:`TileIndex`; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+        by: tiles column to split the counts by, e.g. 'PASS' or 'PROGRAM'
+        nproc: number of threads to split the points over
+        chunksize: number of points per query chunk
+
+    Returns:
+        integer array counts[len(ra)]; or if `by` is set, tuple
+        (values, counts) where values are the unique values of tiles[by]
+        and counts[i, j] is the number of tiles with value values[j]
+        covering point i.
+    """
+    index = get_tile_index(tiles, radius=radius)
+    ra, dec = np.atleast_1d(ra), np.atleast_1d(dec)
+    chunksize = min(chunksize, max(1, -(-len(ra) // max(nproc, 1))))
+    def xyzfunc(i, j):
+        return _embed_sphere(ra[i:j], dec[i:j])
+    return _coverage_counts(tiles, index, xyzfunc, len(ra), by,
+                            index.threshold(radius), nproc, chunksize)
+
+def tile_coverage_map(nside, tiles=None, radius=None, by=None, nproc=1,
+                      chunksize=1000000):
+    """Returns a HEALPix map of the number of tiles covering each pixel center.
+
+    Args:
+        nside: integer healpix nside, 2**k with 1 <= k <= 30
+
+    Optional:
+        tiles, radius, by, nproc, chunksize: see :func:`tile_coverage_counts`
+
+    Returns:
+        integer array counts[npix] in nested pixel order; or if `by` is set,
+        tuple (values, counts) with counts[npix, len(values)]
+    """
+    import healpy as hp
+    index = get_tile_index(tiles, radius=radius)
+    npix = hp.nside2npix(nside)
+    chunksize = min(chunksize, max(1, -(-npix // max(nproc, 1))))
+    def xyzfunc(i, j):
+        return np.array(hp.pix2vec(nside, np.arange(i, j), nest=True)).T
+    return _coverage_counts(tiles, index, xyzfunc, npix, by,
+                            index.threshold(radius), nproc, chunksize)
+
+class TileCoverage(object):
+    """Mutable tile coverage of a fixed set of target positions.
+
+    The targets are indexed once with a KD-tree; tiles are then inserted
+    and deleted by TILEID, and only the targets within `radius` of those
+    tiles are updated, so each update costs time in proportion to the
+    changed tiles and the targets they cover rather than the survey size.
+
+    Parameters
+    ----------
+    ra, dec : array-like
+        Target coordinates in degrees.
+    tileids : array-like, optional
+        TILEIDs of the initially included tiles.
+    tiles : Table-like, optional
+        Table with TILEID,RA,DEC columns to look up tile IDs;
+        if None use desimodel.io.load_tiles().
+    radius : :class:`float`, optional
+        Tile radius in degrees;
+        if None use desimodel.focalplane.get_tile_radius_deg().
+
+    Attributes
+    ----------
+    counts : :class:`numpy.ndarray`
+        Number of included tiles covering each target.
+    """
+
+    def __init__(self, ra, dec, tileids=(), tiles=None, radius=None):
+        from scipy.spatial import cKDTree as KDTree
+
+        if tiles is None:
+            self._tileids, self._rows, self.tiles = io.load_tileid_index()
+        else:
+            self.tiles = tiles
+            self._rows = np.argsort(tiles['TILEID'], kind='mergesort')
+            self._tileids = np.asarray(tiles['TILEID'])[self._rows]
+
+        if radius is None:
+            radius = focalplane.get_tile_radius_deg()
+
+        self.radius = radius
+        self.tree = KDTree(np.atleast_2d(_embed_sphere(np.atleast_1d(ra),
+                                                       np.atleast_1d(dec))))
+        self.counts = np.zeros(self.tree.n, dtype=np.int32)
+        self._included = set()
+        self.insert(tileids)
+
+    def __len__(self):
+        return len(self._included)
+
+    def __contains__(self, tileid):
+        return tileid in self._included
+
+    @property
+    def tileids(self):
+        """Sorted array of the included TILEIDs"""
+        return np.array(sorted(self._included), dtype=self._tileids.dtype)
+
+    @property
+    def covered(self):
+        """Boolean array of targets covered by at least one tile"""
+        return self.counts > 0
+
+    def _tile_rows(self, tileids):
+        """Returns rows of self.tiles for `tileids`, raising ValueError for
+        unknown TILEIDs.
+        """
+        tileids = np.atleast_1d(np.asarray(tileids, dtype=self._tileids.dtype))
+        i = np.clip(np.searchsorted(self._tileids, tileids), 0,
+                    max(len(self._tileids)-1, 0))
+        if len(self._tileids) == 0:
+            found = np.zeros(len(tileids), dtype=bool)
+        else:
+            found = self._tileids[i] == tileids
+        if not np.all(found):
+            raise ValueError('unknown TILEIDs {}'.format(list(tileids[~found])))
+        return self._rows[i]
+
+    def _update(self, tileids, sign):
+        rows = self._tile_rows(tileids)
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+        xyz = _embed_sphere(self.tiles['RA'][rows], self.tiles['DEC'][rows])
+        ii = self.tree.query_ball_point(np.atleast_2d(xyz), _radius2chord(self.radius))
+        ii = np.concatenate([np.asarray(x, dtype=np.int64) for x in ii])
+        targets, n = np.unique(ii, return_counts=True)
+        self.counts[targets] += sign * n.astype(self.counts.dtype)
+        return targets
+
+    def insert(self, tileids):
+        """Adds tiles by TILEID.
+
+        TILEIDs that are already included are ignored.  Returns the
+        sorted indices of the targets whose counts changed.
+        """
+        tileids = [t for t in np.unique(np.atleast_1d(tileids)).tolist()
+                   if t not in self._included]
+        targets = self._update(tileids, +1)
+        self._included.update(tileids)
+        return targets
+
+    def delete(self, tileids):
+        """Removes tiles by TILEID.
+
+        TILEIDs that are not included are ignored.  Returns the
+        sorted indices of the targets whose counts changed.
+        """
+        tileids = [t for t in np.unique(np.atleast_1d(tileids)).tolist()
+                   if t in self._included]
+        targets = self._update(tileids, -1)
+        self._included.difference_update(tileids)
+        return targets
+
+class FootprintMask(object):
+    """Multi-order HEALPix mask of the tile footprint.
+
+    Every pixel is marked as fully inside the footprint (`IN`), fully
+    outside (`OUT`) or straddling its edge (`BOUNDARY`).  Boundary
+    pixels are refined by a factor of 2 in nside per level up to
+    `maxnside`, so a point lookup is a single :func:`radec2pix` plus an
+    array gather per level, and only points in the remaining boundary
+    pixels need the exact KD-tree test of :func:`is_point_in_desi`.
+    Use :func:`get_footprint_mask` to get a cached instance.
+
+    Parameters
+    ----------
+    tiles : Table-like, optional
+        Table with RA,DEC columns; if None use desimodel.io.load_tiles().
+    radius : :class:`float`, optional
+        Tile radius in degrees;
+        if None use desimodel.focalplane.get_tile_radius_deg().
+    nside : :class:`int`, optional
+        HEALPix nside of the coarsest, dense, level.
+    maxnside : :class:`int`, optional
+        HEALPix nside of the finest level.
+    """
+    OUT = 0
+    IN = 1
+    BOUNDARY = 2
+
+    def __init__(self, tiles=None, radius=None, nside=64, maxnside=1024):
+        import healpy as hp
+
+        if tiles is None:
+            tiles = io.load_tiles()
+
+        if radius is None:
+            radius = focalplane.get_tile_radius_deg()
+
+        if maxnside < nside:
+            raise ValueError('maxnside {} < nside {}'.format(maxnside, nside))
+
+        self.radius = float(radius)
+        self.tiles = np.zeros(len(tiles), dtype=[('RA', 'f8'), ('DEC', 'f8')])
+        self.tiles['RA'] = tiles['RA']
+        self.tiles['DEC'] = tiles['DEC']
+        index = get_tile_index(self.tiles, radius=self.radius)
+
+        self.nsides = [nside]
+        self.pixels = [None]
+        self.states = [self._classify(index, nside, np.arange(hp.nside2npix(nside)))]
+        while self.nsides[-1] < maxnside:
+            parents = np.where(self.states[-1] == self.BOUNDARY)[0]
+            if self.pixels[-1] is not None:
+                parents = self.pixels[-1][parents]
+            children = (4*parents[:, None] + np.arange(4)).ravel()
+            self.nsides.append(2*self.nsides[-1])
+            self.pixels.append(children)
+            self.states.append(self._classify(index, self.nsides[-1], children))
+
+    @classmethod
+    def _classify(cls, index, nside, pixels, radius=None):
+        """Returns IN/OUT/BOUNDARY states of nested `pixels` at `nside`
+        for tiles of `radius` degrees, defaulting to the index radius.
+        """
+        import healpy as hp
+        if radius is None:
+            radius = index.radius
+        xyz = np.array(hp.pix2vec(nside, pixels, nest=True)).T
+        d = index.tree.query(xyz, k=1)[0]
+        #- angle to the nearest tile and pixel radius, in degrees
+        sep = np.degrees(2*np.arcsin(np.minimum(d/2, 1)))
+        pixrad = np.degrees(hp.max_pixrad(nside)) + 1e-9
+        states = np.empty(len(pixels), dtype=np.uint8)
+        states[:] = cls.BOUNDARY
+        states[sep + pixrad < radius] = cls.IN
+        states[sep - pixrad > radius] = cls.OUT
+        return states
+
+    @property
+    def maxnside(self):
+        return self.nsides[-1]
+
+    def state(self, ra, dec):
+        """Returns IN/OUT/BOUNDARY state of the finest pixel containing
+        each (ra, dec) point.
+        """
+        pix = np.atleast_1d(radec2pix(self.maxnside, np.asarray(ra), np.asarray(dec)))
+        #- nested pixel number at nside is pix >> 2*log2(maxnside/nside)
+        shifts = [2*int(np.log2(self.maxnside // nside)) for nside in self.nsides]
+        states = np.asarray(self.states[0])[pix >> shifts[0]]
+        for k in range(1, len(self.nsides)):
+            ii = np.where(states == self.BOUNDARY)[0]
+            if len(ii) == 0:
+                break
+            j = np.searchsorted(self.pixels[k], pix[ii] >> shifts[k])
+            states[ii] = self.states[k][j]
+        if np.isscalar(ra):
+            return states[0]
+        return states
+
+    def contains(self, ra, dec):
+        """Returns if (ra, dec) points are in the footprint.
+
+        Equivalent to :func:`is_point_in_desi` with the tiles and radius
+        of this mask, but only boundary points are tested with the KD-tree.
+        """
+        states = np.atleast_1d(self.state(ra, dec))
+        indesi = states == self.IN
+        ii = np.where(states == self.BOUNDARY)[0]
+        if len(ii) > 0:
+            index = get_tile_index(self.tiles, radius=self.radius)
+            indesi[ii] = is_point_in_desi(index, np.atleast_1d(ra)[ii],
+                                          np.atleast_1d(dec)[ii])
+        if np.isscalar(ra):
+            return indesi[0]
+        return indesi
+
+    def write(self, filename):
+        """Writes the mask to a FITS file that :meth:`read` memory-maps"""
+        from astropy.io import fits
+        hdr = fits.Header()
+        hdr['RADIUS'] = self.radius
+        hdulist = fits.HDUList([fits.PrimaryHDU(header=hdr)])
+        hdu = fits.ImageHDU(np.asarray(self.states[0]), name='LEVEL0')
+        hdu.header['NSIDE'] = self.nsides[0]
+        hdulist.append(hdu)
+        for i in range(1, len(self.nsides)):
+            cols = [fits.Column(name='PIXEL', format='K', array=self.pixels[i]),
+                    fits.Column(name='STATE', format='B', array=self.states[i])]
+            hdu = fits.BinTableHDU.from_columns(cols, name='LEVEL{}'.format(i))
+            hdu.header['NSIDE'] = self.nsides[i]
+            hdulist.append(hdu)
+        hdulist.append(fits.BinTableHDU(self.tiles, name='TILES'))
+        tmpfile = '{}.{}.tmp'.format(filename, os.getpid())
+        hdulist.writeto(tmpfile)
+        os.rename(tmpfile, filename)
+
+    @classmethod
+    def read(cls, filename):
+        """Returns a FootprintMask memory-mapped from `filename`"""
+        from astropy.io import fits
+        self = cls.__new__(cls)
+        with fits.open(filename, memmap=True) as hdulist:
+            self.radius = hdulist[0].header['RADIUS']
+            self.nsides = [hdulist['LEVEL0'].header['NSIDE']]
+            self.pixels = [None]
+            self.states = [hdulist['LEVEL0'].data]
+            i = 1
+            while 'LEVEL{}'.format(i) in hdulist:
+                hdu = hdulist['LEVEL{}'.format(i)]
+                self.nsides.append(hdu.header['NSIDE'])
+                self.pixels.append(hdu.data['PIXEL'])
+                self.states.append(hdu.data['STATE'])
+                i += 1
+            self.tiles = np.asarray(hdulist['TILES'].data)
+        return self
+
+_footprint_mask = _LRUCache()
+def get_footprint_mask(tiles=None, radius=None, nside=64, maxnside=1024):
+    """Returns a cached :class:`FootprintMask`.
+
+    The mask is cached in memory, and on disk in $DESIMODEL_CACHE if set,
+    keyed on the tile RA,DEC content, radius, nside and maxnside.
+    Disk cached masks are memory-mapped.
+
+    Args:
+        tiles: Table-like with RA,DEC columns; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+        nside: HEALPix nside of the coarsest mask level
+        maxnside: HEALPix nside of the finest mask level
+
+    Returns:
+        :class:`FootprintMask`
+    """
+    import hashlib
+    global _footprint_mask
+    if tiles is None:
+        tiles = io.load_tiles()
+
+    if radius is None:
+        radius = focalplane.get_tile_radius_deg()
+
+    key = hashlib.md5('{}-{}-{!r}-{}'.format(nside, maxnside, float(radius),
+        _tiles_hash(tiles)).encode()).hexdigest()
+    if key not in _footprint_mask:
+        filename = None
+        if io.cachedir() is not None:
+            filename = os.path.join(io.cachedir(), 'footprintmask-{}.fits'.format(key))
+        if filename is not None and os.path.exists(filename):
+            mask = FootprintMask.read(filename)
+        else:
+            mask = FootprintMask(tiles, radius=radius, nside=nside, maxnside=maxnside)
+            if filename is not None:
+                io._makedirs(io.cachedir())
+                mask.write(filename)
+        _footprint_mask[key] = mask
+
+    return _footprint_mask[key]
+
+_pixweight = _LRUCache()
+def pixweight(nside, tiles=None, radius=None, precision=0.01, nproc=1,
+              chunksize=10000):
+    '''
+    Returns the fraction of each HEALPix pixel covered by the tiles
+
+    Args:
+        nside: integer healpix nside, 2**k with 1 <= k <= 30
+
+    Optional:
+        tiles: Table-like with RA,DEC columns; or a :class:`TileIndex`; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg(),
+            or the radius of `tiles` if it is a :class:`TileIndex`
+        precision: resolution of the covered fraction; pixels on the
+            footprint edge are sampled with at least 1/precision
+            sub-pixels at a higher nside
+        nproc: number of threads to split the edge pixels over
+        chunksize: number of edge pixels per chunk
+
+    Returns:
+        float array weights[npix] in nested pixel order, 1 for pixels
+        fully inside the footprint and 0 for pixels fully outside.
+
+    Pixels are classified as in :class:`FootprintMask`; only the edge
+    pixels are sub-sampled, refining sub-pixels that are themselves on
+    the edge one level at a time.  Results are cached in memory, and on disk
+    in $DESIMODEL_CACHE if set, keyed on nside, precision, radius and
+    the tile content.
+    '''
+    import hashlib
+    import healpy as hp
+    global _pixweight
+    index = get_tile_index(tiles, radius=radius)
+    if radius is None:
+        radius = index.radius
+
+    #- sub-pixels per pixel is 4**order >= 1/precision
+    order = max(0, int(np.ceil(np.log(1.0/precision) / np.log(4))))
+    key = hashlib.md5('{}-{}-{!r}-{}'.format(nside, order, float(radius),
+        _tiles_hash(index.tiles)).encode()).hexdigest()
+    cachename = 'pixweight-{}'.format(key)
+    if key in _pixweight:
+        return _pixweight[key]
+
+    cached = io.load_cache(cachename, ['weight'])
+    if cached is not None:
+        _pixweight[key] = cached['weight']
+        return _pixweight[key]
+
+    npix = hp.nside2npix(nside)
+    states = FootprintMask._classify(index, nside, np.arange(npix), radius)
+    weight = (states == FootprintMask.IN).astype(float)
+    edge = np.where(states == FootprintMask.BOUNDARY)[0]
+
+    threshold = index.threshold(radius)
+    def subsample(i, j):
+        #- refine edge pixels level by level; sub-pixels classified as
+        #- fully in or out are resolved without sampling their centers
+        fraction = np.zeros(j-i)
+        pix = edge[i:j]
+        owner = np.arange(j-i)
+        for level in range(1, order+1):
+            pix = (pix[:, None]*4 + np.arange(4)).ravel()
+            owner = np.repeat(owner, 4)
+            subnside = nside * 2**level
+            if level < order:
+                substates = FootprintMask._classify(index, subnside, pix, radius)
+                ii = substates == FootprintMask.IN
+                fraction += np.bincount(owner[ii], minlength=j-i) / 4.0**level
+                ii = substates == FootprintMask.BOUNDARY
+                pix, owner = pix[ii], owner[ii]
+        xyz = np.array(hp.pix2vec(nside * 2**order, pix, nest=True)).T
+        inside = index.tree.query(np.atleast_2d(xyz), k=1)[0] < threshold
+        fraction += np.bincount(owner[inside], minlength=j-i) / 4.0**order
+        return fraction
+
+    if len(edge) > 0:
+        weight[edge] = np.concatenate(_map_chunks(subsample, len(edge), nproc,
+            min(chunksize, max(1, -(-len(edge) // max(nproc, 1))))))
+
+    io.write_cache(cachename, dict(weight=weight))
+    weight.setflags(write=False)
+    _pixweight[key] = weight
+    return weight
+
+def random_points(n, seed=0, chunksize=1000000, chunks=None, tiles=None,
+                  radius=None, nside=64, maxnside=1024):
+    """Generates uniform random points in the tile footprint.
+
+    Points are drawn only from pixels of the :func:`get_footprint_mask`
+    mask that are inside or on the edge of the footprint, so only points
+    in edge pixels need the exact :func:`is_point_in_desi` test.
+
+    Args:
+        n: total number of random points
+        seed: integer random seed
+
+    Optional:
+        chunksize: number of points per generated chunk
+        chunks: iterable of chunk numbers to generate, out of
+            ceil(n/chunksize); if None generate all chunks in order
+        tiles: Table-like with RA,DEC columns; or
+            None to use all DESI tiles from desimodel.io.load_tiles()
+        radius: tile radius in degrees;
+            if None use desimodel.focalplane.get_tile_radius_deg()
+        nside, maxnside: nside range of the footprint mask
+
+    Yields:
+        tuple (ra, dec) of arrays in degrees for each chunk, with
+        `chunksize` points except for a shorter last chunk.
+
+    Chunk k is drawn from its own random stream seeded by (seed, k), so it
+    is the same however the chunks are split across jobs, e.g. with
+    ``chunks=range(rank, nchunks, size)``.
+    """
+    import healpy as hp
+    mask = get_footprint_mask(tiles, radius=radius, nside=nside, maxnside=maxnside)
+    index = get_tile_index(mask.tiles, radius=mask.radius)
+
+    #- leaf pixels: IN at any level, and BOUNDARY at the finest level
+    leaves, levels, edges = list(), list(), list()
+    for k in range(len(mask.nsides)):
+        states = np.asarray(mask.states[k])
+        last = (k == len(mask.nsides)-1)
+        ii = (states == mask.IN) | (last & (states == mask.BOUNDARY))
+        ii = np.where(ii)[0]
+        pixels = ii if mask.pixels[k] is None else np.asarray(mask.pixels[k])[ii]
+        leaves.append(pixels.astype(np.int64))
+        levels.append(np.full(len(ii), k, dtype=np.int64))
+        edges.append(states[ii] == mask.BOUNDARY)
+    leaves = np.concatenate(leaves)
+    levels = np.concatenate(levels)
+    edges = np.concatenate(edges)
+    if len(leaves) == 0:
+        raise ValueError('footprint mask has no pixels in the footprint')
+
+    #- pick leaves by area, then a nested sub-pixel at the finest
+    #- healpy nside, which is uniform within the leaf
+    cumarea = np.cumsum(4.0**(-levels))
+    subnside = 2**29
+    suborder = 2*(int(np.log2(subnside // mask.nsides[0])) - levels)
+
+    nchunks = -(-n // chunksize)
+    if chunks is None:
+        chunks = range(nchunks)
+    for k in chunks:
+        if k < 0 or k >= nchunks:
+            raise ValueError('chunk {} out of range 0..{}'.format(k, nchunks-1))
+        rng = np.random.RandomState([seed, k])
+        size = min(chunksize, n - k*chunksize)
+        ra = np.zeros(0)
+        dec = np.zeros(0)
+        while len(ra) < size:
+            m = size - len(ra)
+            i = np.searchsorted(cumarea, rng.uniform(0, cumarea[-1], m), side='right')
+            i = np.minimum(i, len(leaves)-1)
+            sub = (rng.uniform(0, 1, m) * 2.0**suborder[i]).astype(np.int64)
+            pix = (leaves[i] << suborder[i]) + sub
+            theta, phi = hp.pix2ang(subnside, pix, nest=True)
+            newra = np.degrees(phi)
+            newdec = 90.0 - np.degrees(theta)
+            keep = ~edges[i]
+            jj = np.where(edges[i])[0]
+            if len(jj) > 0:
+                keep[jj] = is_point_in_desi(index, newra[jj], newdec[jj])
+            ra = np.concatenate([ra, newra[keep]])
+            dec = np.concatenate([dec, newdec[keep]])
+        yield ra[0:size], dec[0:size]
+
 #
 #
 #
+def _tileid_rows(tileids):
+    """Return (rows, found, tiles) locating `tileids` in io.load_tiles().
+
+    rows[i] is the row of tiles with TILEID tileids[i] where found[i] is True.
+    """
+    sorted_ids, order, tiles = io.load_tileid_index()
+    tileids = np.asarray(tileids)
+    if len(sorted_ids) == 0:
+        return (np.zeros(tileids.shape, dtype=int),
+                np.zeros(tileids.shape, dtype=bool), tiles)
+    i = np.searchsorted(sorted_ids, tileids)
+    i = np.clip(i, 0, len(sorted_ids)-1)
+    found = sorted_ids[i] == tileids
+    return order[i], found, tiles
+
 def get_tile_radec(tileid):
     """Return (ra, dec) in degrees for the requested tileid.
 
     If tileid is not in DESI, return (0.0, 0.0)
     TODO: should it raise and exception instead?
+
+    tileid may also be an array of tile IDs, in which case arrays
+    of ra and dec are returned, with 0.0 for tiles not in DESI.
     """
-    tiles = io.load_tiles()
-    if tileid in tiles['TILEID']:
-        i = np.where(tiles['TILEID'] == tileid)[0][0]
-        return tiles[i]['RA'], tiles[i]['DEC']
+    rows, found, tiles = _tileid_rows(tileid)
+    ra = np.where(found, tiles['RA'][rows], 0.0)
+    dec = np.where(found, tiles['DEC'][rows], 0.0)
+    if np.isscalar(tileid):
+        return ra[()], dec[()]
     else:
-        return (0.0, 0.0)
-
+        return ra, dec
@@ -75,7 +75,7 @@ def load_fiberpos():
     global _fiberpos
     from astropy.table import Table
     if _fiberpos is None:
-        fiberposfile = os.path.join(os.environ['DESIMODEL'],'data','focalplane','fiberpos.fits')
+        fiberposfile = findfile('focalplane/fiberpos.fits')
         _fiberpos = Table.read(fiberposfile)
         #- Convert to upper case if needed
         #- Make copy of colnames b/c they are updated during iteration
@@ -145,6 +145,39 @@ def load_tiles(onlydesi=True, extra=False):
     else:
         return _tiles[subset]
 
+_tileid_index = dict()
+def load_tileid_index(onlydesi=True, extra=False):
+    """Return a cached TILEID lookup index for :func:`load_tiles`.
+
+    The index is built once per (`onlydesi`, `extra`) selection and is
+    rebuilt if the underlying tiles cache is reloaded.
+
+    Parameters
+    ----------
+    onlydesi : :class:`bool` (default True)
+        If ``True``, trim to just the tiles in the DESI footprint.
+    extra : :class:`bool`, (default False)
+        If ``True``, include extra layers with PROGRAM='EXTRA'.
+
+    Returns
+    -------
+    :func:`tuple`
+        A tuple (tileids, rows, tiles) where `tileids` is the sorted array
+        of TILEIDs, ``tiles[rows[i]]`` is the tile with TILEID
+        ``tileids[i]``, and `tiles` is the table returned by
+        ``load_tiles(onlydesi, extra)``.
+    """
+    global _tileid_index
+    key = (onlydesi, extra)
+    if (_tiles is None or key not in _tileid_index or
+        _tileid_index[key][0] is not _tiles):
+        tiles = load_tiles(onlydesi=onlydesi, extra=extra)
+        rows = np.argsort(tiles['TILEID'], kind='mergesort')
+        tileids = np.asarray(tiles['TILEID'])[rows]
+        _tileid_index[key] = (_tiles, tileids, rows, tiles)
+
+    return _tileid_index[key][1:]
+
 _platescale = None
 def load_platescale():
     '''
@@ -207,3 +240,69 @@ def datadir():
     else:
         import pkg_resources
         return pkg_resources.resource_filename('desimodel', 'data')
+
+def cachedir():
+    '''
+    Returns location for cached derived products, or None if disabled
+
+    Caching of derived products (e.g. tile -> healpix coverage) to disk
+    is enabled by setting $DESIMODEL_CACHE to a writeable directory.
+    '''
+    if os.environ.get('DESIMODEL_CACHE'):
+        return os.path.abspath(os.environ['DESIMODEL_CACHE'])
+    else:
+        return None
+
+def _cachefile(name, key):
+    return os.path.join(cachedir(), '{}-{}.npy'.format(name, key))
+
+def load_cache(name, keys):
+    '''
+    Returns dict of memory-mapped arrays previously written by write_cache
+
+    Args:
+        name: cache entry name, e.g. 'tiles2pix-<hash>'
+        keys: list of array names to load
+
+    Returns None if caching is disabled or any of the arrays is missing.
+    '''
+    if cachedir() is None:
+        return None
+
+    filenames = [_cachefile(name, key) for key in keys]
+    if not all([os.path.exists(x) for x in filenames]):
+        return None
+
+    return dict([(key, np.load(x, mmap_mode='r'))
+                 for key, x in zip(keys, filenames)])
+
+def _makedirs(path):
+    '''
+    Creates directory path if needed, tolerating concurrent jobs creating it
+    '''
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            if not os.path.isdir(path):
+                raise
+
+def write_cache(name, arrays):
+    '''
+    Writes dict of arrays to $DESIMODEL_CACHE for later use by load_cache
+
+    Does nothing if caching is disabled.  Each array is written to a
+    temporary file and renamed into place so that concurrent jobs never
+    read a partially written cache entry.
+    '''
+    if cachedir() is None:
+        return
+
+    _makedirs(cachedir())
+
+    for key, data in arrays.items():
+        filename = _cachefile(name, key)
+        tmpfile = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(tmpfile, 'wb') as fx:
+            np.save(fx, np.asarray(data))
+        os.rename(tmpfile, filename)
@@ -16,12 +16,14 @@ Mayall telescope at KPNO, as described and analyzed in this reference:
   <https://doi.org/10.1086/675808>`__.
 
 The seeing values modeled here should normally be scaled to the observing
-wavelength and airmass.  For DESI simulations, these scalings are applied
-in the `specsim package <http://specsim.readthedocs.io/>`__.
+wavelength and airmass, for example with :func:`scaled_fwhm`.  For DESI
+simulations, these scalings are applied in the
+`specsim package <http://specsim.readthedocs.io/>`__.
 """
 from __future__ import print_function, division
 
 import numpy as np
+import scipy.signal
 import scipy.special
 
 
@@ -75,8 +77,49 @@ def relative_probability(fwhm_arcsec, blur_arcsec=0.219):
     return eqn1 / eqn1.sum()
 
 
+# Cache of un-whitening tables for sample().
+#
+# Keys are (max_seeing, blur_arcsec) and values are tuples (seeing_grid,
+# seeing_cdf, x_table), where x_table tabulates the seeing corresponding to
+# whitened values on the uniform grid defined by _x_min, _x_max and _x_size.
+_cdf_tables = {}
+_x_min, _x_max, _x_size = -8., 8., 16001
+
+
+def _get_cdf_table(max_seeing, blur_arcsec):
+    """Return the cached un-whitening tables for :func:`sample`.
+
+    Parameters
+    ----------
+    max_seeing : float
+        Maximum FWHM zenith seeing at 6355A to tabulate.
+    blur_arcsec : float
+        RMS instrumental blur passed to :func:`relative_probability`.
+
+    Returns
+    -------
+    tuple
+        Tuple (seeing_grid, seeing_cdf, x_table) of read-only arrays.
+    """
+    key = (float(max_seeing), float(blur_arcsec))
+    if key not in _cdf_tables:
+        # Build a grid covering the range of allowed FWHM seeing values.
+        seeing_grid = np.linspace(0., max_seeing, 1000)
+        # Build a table of cummulative probabilities.
+        seeing_cdf = np.cumsum(relative_probability(seeing_grid, blur_arcsec))
+        # Tabulate the inverse CDF of the Gaussian CDF of whitened values.
+        x_grid = np.linspace(_x_min, _x_max, _x_size)
+        x_cdf = 0.5 * (1 + scipy.special.erf(x_grid / np.sqrt(2)))
+        x_table = np.interp(x_cdf, seeing_cdf, seeing_grid)
+        for table in (seeing_grid, seeing_cdf, x_table):
+            table.setflags(write=False)
+        _cdf_tables[key] = (seeing_grid, seeing_cdf, x_table)
+    return _cdf_tables[key]
+
+
 def sample(n_sample, dt_sec=300., max_seeing=5., seed=None,
-           psd_tau1=0.025, psd_tau2=5.):
+           psd_tau1=0.025, psd_tau2=5., blur_arcsec=0.219,
+           n_realizations=None, dtype=float):
     """Generate random samples of FWHM zenith seeing at 6355A.
 
     Samples are generated as a time series on a uniform grid of observation
@@ -118,22 +161,30 @@ def sample(n_sample, dt_sec=300., max_seeing=5., seed=None,
     psd_tau2 : float
         Time constant associated with the autocorrelation power spectral
         density, in units of days.
+    blur_arcsec : float
+        RMS instrumental blur passed to :func:`relative_probability`.
+    n_realizations : int or None
+        Number of independent time series to generate.  Use the default
+        value of None to generate a single 1D series.  Realization k is
+        generated from its own random stream seeded with ``[seed, k]``,
+        so it does not depend on n_realizations.
+    dtype : numpy dtype
+        Data type of the returned array.  Use ``np.float32`` to halve the
+        memory required for many realizations.
 
     Returns
     -------
     array:
-        Array of generated seeing samples on a uniform time grid.  All values
+        Array of generated seeing samples on a uniform time grid, with shape
+        (n_realizations, n_sample) if n_realizations is not None.  All values
         will be in the range [0, max_seeing] and represent FWHM zenith
         seeing at 6355A.
     """
     if n_sample < 2:
         raise ValueError('n_sample must be at least 2.')
 
-    # Build a grid covering the range of allowed FWHM seeing values.
-    seeing_grid = np.linspace(0., max_seeing, 1000)
-
-    # Build a table of cummulative probabilities.
-    seeing_cdf = np.cumsum(relative_probability(seeing_grid))
+    # Look up the cached table for un-whitening samples.
+    _, _, x_table = _get_cdf_table(max_seeing, blur_arcsec)
 
     # Build a linear grid of frequencies present in the Fourier transform
     # of the requested time series.  Frequency units are 1/day.
@@ -152,18 +203,161 @@ def sample(n_sample, dt_sec=300., max_seeing=5., seed=None,
     # Force the variance to one.
     psd[1:] /= psd[1:].sum() * df_day ** 2
 
-    # Generate random whitened samples using the specified seed.
-    gen = np.random.RandomState(seed)
-    n_psd = len(psd)
-    x_fft = np.ones(n_psd, dtype=complex)
-    x_fft[1:-1].real = gen.normal(size=n_psd - 2)
-    x_fft[1:-1].imag = gen.normal(size=n_psd - 2)
-    x_fft *= np.sqrt(psd) / (2 * dt_day)
-    x_fft[0] *= np.sqrt(2)
-    x = np.fft.irfft(x_fft, n_sample)
-
-    # Un-whiten the samples to recover the desired 1D PDF.
-    x_cdf = 0.5 * (1 + scipy.special.erf(x / np.sqrt(2)))
-    seeing = np.interp(x_cdf, seeing_cdf, seeing_grid)
+    amplitude = np.sqrt(psd) / (2 * dt_day)
+
+    if n_realizations is None:
+        # Generate random whitened samples using the specified seed.
+        x = _whitened(n_sample, amplitude, [np.random.RandomState(seed)])[0]
+        # Un-whiten the samples to recover the desired 1D PDF.
+        return _unwhiten(x, x_table).astype(dtype, copy=False)
+
+    if n_realizations < 1:
+        raise ValueError('n_realizations must be at least 1.')
+    if seed is None:
+        seed = np.random.RandomState().randint(2 ** 31)
+    seeing = np.empty((n_realizations, n_sample), dtype=dtype)
+    # Generate realizations in blocks of about 4M samples so that the
+    # float64 work arrays stay small compared with the output.
+    block = max(1, 2 ** 22 // n_sample)
+    for i in range(0, n_realizations, block):
+        j = min(i + block, n_realizations)
+        gens = [np.random.RandomState([seed, k]) for k in range(i, j)]
+        seeing[i:j] = _unwhiten(_whitened(n_sample, amplitude, gens), x_table)
 
     return seeing
+
+
+def sample_stream(chunk_size=8192, dt_sec=300., max_seeing=5., seed=None,
+                  psd_tau1=0.025, psd_tau2=5., blur_arcsec=0.219,
+                  n_filter=None):
+    """Generate an unbounded time series of FWHM zenith seeing at 6355A.
+
+    This is a streaming version of :func:`sample` that yields consecutive
+    chunks of a single continuous time series, with constant memory and
+    cost per chunk.  The whitened fluctuations are generated by filtering
+    white noise with a finite impulse response filter whose power
+    spectrum matches the one used by :func:`sample`, and are then
+    transformed to the same 1D distribution.  The filter is applied by
+    overlap-save, carrying the last ``n_filter - 1`` noise samples from
+    one chunk to the next, so there are no discontinuities at chunk
+    boundaries and the series does not depend on `chunk_size`.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Number of samples in each yielded chunk.
+    dt_sec : float
+        Elapsed time in seconds between generated samples.
+    max_seeing : float
+        Maximum FWHM zenith seeing at 6355A to generate.
+    seed : int or None
+        Random number seed to use for reproducible samples.
+    psd_tau1 : float
+        Time constant associated with the autocorrelation power spectral
+        density, in units of days.
+    psd_tau2 : float
+        Time constant associated with the autocorrelation power spectral
+        density, in units of days.
+    blur_arcsec : float
+        RMS instrumental blur passed to :func:`relative_probability`.
+    n_filter : int or None
+        Length of the filter in samples.  The default is the power of two
+        covering at least 10 * psd_tau2, which captures the low-frequency
+        power of the spectrum.
+
+    Yields
+    ------
+    array
+        Arrays of `chunk_size` consecutive seeing samples on a uniform time
+        grid, with values in the range [0, max_seeing].
+    """
+    if chunk_size < 1:
+        raise ValueError('chunk_size must be at least 1.')
+
+    _, _, x_table = _get_cdf_table(max_seeing, blur_arcsec)
+    dt_day = dt_sec / (24. * 3600.)
+    if n_filter is None:
+        n_filter = 2 ** int(np.ceil(np.log2(10. * psd_tau2 / dt_day)))
+
+    # Build a zero-phase filter with the requested PSD and normalize it
+    # so that filtered unit white noise has unit variance.
+    f_grid = np.arange(1 + (n_filter // 2)) / (n_filter * dt_day)
+    omega = 2 * np.pi * f_grid
+    psd = 1. / (1. + omega * psd_tau1) / (1. + omega * psd_tau2)
+    kernel = np.roll(np.fft.irfft(np.sqrt(psd), n_filter), n_filter // 2)
+    kernel /= np.sqrt(np.sum(kernel ** 2))
+
+    gen = np.random.RandomState(seed)
+    noise = gen.normal(size=n_filter - 1)
+    while True:
+        noise = np.concatenate((noise, gen.normal(size=chunk_size)))
+        x = scipy.signal.fftconvolve(noise, kernel, mode='valid')
+        noise = noise[chunk_size:]
+        yield _unwhiten(x, x_table)
+
+
+def _whitened(n_sample, amplitude, gens):
+    """Generate whitened time series with the tabulated PSD amplitude.
+
+    Returns an array of shape (len(gens), n_sample) using one random
+    generator per series and a single inverse FFT along the time axis.
+    """
+    n_psd = len(amplitude)
+    x_fft = np.ones((len(gens), n_psd), dtype=complex)
+    for row, gen in zip(x_fft, gens):
+        row[1:-1].real = gen.normal(size=n_psd - 2)
+        row[1:-1].imag = gen.normal(size=n_psd - 2)
+    x_fft *= amplitude
+    x_fft[:, 0] *= np.sqrt(2)
+    return np.fft.irfft(x_fft, n_sample, axis=-1)
+
+
+def scaled_fwhm(fwhm_arcsec, airmass, wave, wave_ref=6355., out=None):
+    """Scale zenith seeing to the airmass and wavelength of exposures.
+
+    The FWHM scales as airmass ** 0.6 and wavelength ** -0.2, so the
+    result for exposure i at wavelength j is::
+
+        fwhm_arcsec[i] * airmass[i] ** 0.6 * (wave_ref / wave[j]) ** 0.2
+
+    Parameters
+    ----------
+    fwhm_arcsec : float or array
+        FWHM zenith seeing at `wave_ref` of each exposure, e.g. from
+        :func:`sample`.
+    airmass : float or array
+        Airmass of each exposure, broadcast against `fwhm_arcsec`.
+    wave : float or array
+        Wavelengths in Angstroms where the seeing should be evaluated.
+    wave_ref : float
+        Wavelength in Angstroms of the zenith seeing values.
+    out : array or None
+        Optional array of shape (n_exposure, n_wave) to store the result,
+        so that large grids do not allocate a new array.
+
+    Returns
+    -------
+    array
+        Array of shape (n_exposure, n_wave) of FWHM seeing in arcseconds.
+    """
+    exposure_scale = np.multiply(
+        np.atleast_1d(fwhm_arcsec), np.atleast_1d(airmass) ** 0.6)
+    wave_scale = (wave_ref / np.atleast_1d(np.asarray(wave, dtype=float))) ** 0.2
+    shape = (len(exposure_scale), len(wave_scale))
+    if out is not None and out.shape != shape:
+        raise ValueError('out has shape {0} but expected {1}.'
+                         .format(out.shape, shape))
+    return np.multiply(exposure_scale[:, np.newaxis], wave_scale, out=out)
+
+
+def _unwhiten(x, x_table):
+    """Map whitened values to seeing by linear interpolation in x_table.
+
+    The table is on a uniform grid so the lookup is a direct index
+    calculation rather than a search.
+    """
+    dx = (_x_max - _x_min) / (_x_size - 1)
+    u = (np.clip(x, _x_min, _x_max) - _x_min) / dx
+    i = np.minimum(u.astype(int), _x_size - 2)
+    u -= i
+    return x_table[i] * (1 - u) + x_table[i + 1] * u
@@ -2,9 +2,14 @@
 # -*- coding: utf-8 -*-
 """Test desimodel.focalplane.
 """
+import os
 import unittest
 import numpy as np
-from ..focalplane import FocalPlane, generate_random_centroid_offsets
+from ..focalplane import (FocalPlane, generate_random_centroid_offsets,
+                          radec2xy_tiles, xy2radec_tiles, get_platescale)
+
+desimodel_available = 'DESIMODEL' in os.environ
+desimodel_message = "The desimodel data set was not detected."
 
 
 class TestFocalplane(unittest.TestCase):
@@ -66,6 +71,222 @@ class TestFocalplane(unittest.TestCase):
                          ("Test Failed to recover the input RA, Dec with " +
                           "1E-6 precision"))
 
+    def test_plate_angle(self):
+        """Test that plate_angle inverts plate_dist for arrays and scalars.
+        """
+        F = FocalPlane()
+        radius = np.linspace(0., 420., 1001).reshape(7, 143)
+        angle = F.plate_angle(radius)
+        self.assertEqual(angle.shape, radius.shape)
+        self.assertTrue(np.all(np.fabs(F.plate_dist(angle) - radius) <= 1E-8))
+        self.assertTrue(np.all(np.diff(angle.ravel()) > 0))
+        self.assertEqual(np.ndim(F.plate_angle(200.)), 0)
+        self.assertAlmostEqual(F.plate_angle(200.), F.plate_angle(np.array([200.]))[0])
+        self.assertEqual(F.plate_angle(0.), 0.)
+
+    def test_xy2radec_vector(self):
+        """Test that xy2radec on arrays matches element-wise calls.
+        """
+        F = FocalPlane(150.0, 30.0)
+        rng = np.random.RandomState(1)
+        x = rng.uniform(-410, 410, 10000)
+        y = rng.uniform(-410, 410, 10000)
+        ra, dec = F.xy2radec(x, y)
+        self.assertEqual(ra.shape, x.shape)
+        for i in range(0, len(x), 1000):
+            ra1, dec1 = F.xy2radec(x[i], y[i])
+            self.assertIsInstance(ra1, float)
+            self.assertAlmostEqual(ra1, ra[i], places=10)
+            self.assertAlmostEqual(dec1, dec[i], places=10)
+        ra0, dec0 = F.xy2radec(0.0, 0.0)
+        self.assertAlmostEqual(ra0, 150.0)
+        self.assertAlmostEqual(dec0, 30.0)
+        # Positions map to the expected angular distance from the pointing.
+        cosd = (np.sin(np.radians(dec)) * np.sin(np.radians(30.0)) +
+                np.cos(np.radians(dec)) * np.cos(np.radians(30.0)) *
+                np.cos(np.radians(ra - 150.0)))
+        self.assertTrue(np.allclose(np.arccos(np.clip(cosd, -1, 1)),
+                                    F.plate_angle(np.hypot(x, y)), atol=1E-9))
+
+    def test_tiles_batch(self):
+        """Test batch transforms against per-tile FocalPlane calls.
+        """
+        rng = np.random.RandomState(2)
+        tile_ra = np.array([0.0, 10.0, 200.0, 359.0, 45.0])
+        tile_dec = np.array([0.0, 89.0, -30.0, 10.0, 20.0])
+        ra = rng.uniform(0, 360, 2000)
+        dec = rng.uniform(-90, 90, 2000)
+        #- ragged targets per tile, including a tile without targets
+        targets = [rng.choice(len(ra), n, replace=False) for n in (10, 0, 7, 25, 3)]
+        for i in range(len(targets)):
+            ra[targets[i]] = (tile_ra[i] + rng.uniform(-1, 1, len(targets[i]))) % 360
+            dec[targets[i]] = np.clip(tile_dec[i] + rng.uniform(-1, 1, len(targets[i])), -90, 90)
+        offsets = np.cumsum([0] + [len(t) for t in targets])
+        indices = np.concatenate(targets)
+        csr = (offsets, indices, np.diff(offsets))
+
+        x, y = radec2xy_tiles(tile_ra, tile_dec, ra, dec, csr, chunksize=7)
+        self.assertEqual(len(x), offsets[-1])
+        x2, y2 = radec2xy_tiles(tile_ra, tile_dec, ra, dec, targets)
+        self.assertTrue(np.all(x == x2) and np.all(y == y2))
+        x2, y2 = radec2xy_tiles(tile_ra, tile_dec, ra, dec, csr[0:2])
+        self.assertTrue(np.all(x == x2) and np.all(y == y2))
+        ra2, dec2 = xy2radec_tiles(tile_ra, tile_dec, x, y, offsets, chunksize=7)
+        ra3, dec3 = xy2radec_tiles(tile_ra, tile_dec, x, y, csr)
+        self.assertTrue(np.all(ra3 == ra2) and np.all(dec3 == dec2))
+        #- CSR arrays in the wrong order
+        with self.assertRaises(ValueError):
+            radec2xy_tiles(tile_ra, tile_dec, ra, dec, (indices, offsets))
+        with self.assertRaises(ValueError):
+            xy2radec_tiles(tile_ra, tile_dec, x, y, indices)
+        F = FocalPlane()
+        for i in range(len(targets)):
+            F.set_tele_pointing(tile_ra[i], tile_dec[i])
+            s = slice(offsets[i], offsets[i+1])
+            xi, yi = F.radec2xy(ra[targets[i]], dec[targets[i]])
+            self.assertTrue(np.allclose(x[s], xi, rtol=0, atol=1E-8))
+            self.assertTrue(np.allclose(y[s], yi, rtol=0, atol=1E-8))
+            rai, deci = F.xy2radec(x[s], y[s])
+            self.assertTrue(np.allclose(ra2[s], rai, rtol=0, atol=1E-10))
+            self.assertTrue(np.allclose(dec2[s], deci, rtol=0, atol=1E-10))
+        ra3, dec3 = xy2radec_tiles(tile_ra, tile_dec,
+                                   np.split(x, offsets[1:-1]),
+                                   np.split(y, offsets[1:-1]))
+        self.assertTrue(np.all(ra3 == ra2) and np.all(dec3 == dec2))
+        with self.assertRaises(ValueError):
+            radec2xy_tiles(tile_ra + 360, tile_dec, ra, dec, csr)
+
+    @unittest.skipUnless(desimodel_available, desimodel_message)
+    def test_fiberpos(self):
+        """Test that instances share one read-only fiberpos table.
+        """
+        from .. import io
+        F1 = FocalPlane()
+        F2 = FocalPlane(150.0, 30.0)
+        self.assertIs(F1.fiberpos, F2.fiberpos)
+        fiberpos = io.load_fiberpos()
+        self.assertEqual(len(F1.fiberpos), len(fiberpos))
+        self.assertTrue(np.all(F1.fiberpos['X'] == fiberpos['X']))
+        self.assertTrue(np.all(F1.fiberpos['LOCATION'] == fiberpos['LOCATION']))
+        with self.assertRaises(ValueError):
+            F1.fiberpos['X'][0] = 0.0
+
+    @unittest.skipUnless(desimodel_available, desimodel_message)
+    def test_platescale_transform(self):
+        """Test the platescale.txt lookup table transform.
+        """
+        from .. import io
+        platescale = io.load_platescale()
+        theta = np.radians(platescale['theta'])
+        F = FocalPlane(150.0, 30.0, transform='platescale')
+        self.assertTrue(np.allclose(F.plate_dist(theta), platescale['radius'],
+                                    rtol=0, atol=1E-4))
+        self.assertTrue(np.allclose(F.plate_angle(platescale['radius']), theta,
+                                    rtol=0, atol=1E-8))
+        radius = np.linspace(0., 420., 1001).reshape(7, 143)
+        angle = F.plate_angle(radius)
+        self.assertEqual(angle.shape, radius.shape)
+        self.assertTrue(np.allclose(F.plate_dist(angle), radius, rtol=0, atol=1E-4))
+        self.assertEqual(np.ndim(F.plate_angle(200.)), 0)
+        radial, az = get_platescale(platescale['radius'])
+        self.assertTrue(np.allclose(radial, platescale['radial_platescale']))
+        self.assertTrue(np.allclose(az, platescale['az_platescale']))
+        #- batch and per-pointing transforms agree
+        rng = np.random.RandomState(4)
+        ra = 150.0 + rng.uniform(-1.5, 1.5, 100)
+        dec = 30.0 + rng.uniform(-1.5, 1.5, 100)
+        x, y = F.radec2xy(ra, dec)
+        tile_ra, tile_dec = np.array([150.0]), np.array([30.0])
+        x2, y2 = radec2xy_tiles(tile_ra, tile_dec, ra, dec, [np.arange(100)],
+                                transform='platescale')
+        self.assertTrue(np.allclose(x, x2, rtol=0, atol=1E-8))
+        self.assertTrue(np.allclose(y, y2, rtol=0, atol=1E-8))
+        ra2, dec2 = F.xy2radec(x, y)
+        ra3, dec3 = xy2radec_tiles(tile_ra, tile_dec, [x], [y],
+                                   transform='platescale')
+        self.assertTrue(np.allclose(ra2, ra3, rtol=0, atol=1E-10))
+        self.assertTrue(np.allclose(dec2, dec3, rtol=0, atol=1E-10))
+        x0, y0 = F.radec2xy(150.0, 30.0)
+        self.assertAlmostEqual(x0, 0.0)
+        self.assertAlmostEqual(y0, 0.0)
+        #- targets at the table angles from the pointing land at the table
+        #- radii, and map back to the same positions
+        ii = (platescale['theta'] > 0) & (platescale['theta'] < 2.0)
+        dec = 30.0 + platescale['theta'][ii]
+        x, y = F.radec2xy(np.full(len(dec), 150.0), dec)
+        self.assertTrue(np.allclose(np.hypot(x, y), platescale['radius'][ii],
+                                    rtol=0, atol=1E-4))
+        x2, y2 = radec2xy_tiles(tile_ra, tile_dec, np.full(len(dec), 150.0), dec,
+                                [np.arange(len(dec))], transform='platescale')
+        self.assertTrue(np.allclose(np.hypot(x2, y2), platescale['radius'][ii],
+                                    rtol=0, atol=1E-4))
+        ra2, dec2 = F.xy2radec(x, y)
+        self.assertTrue(np.allclose(ra2, 150.0, rtol=0, atol=1E-8))
+        self.assertTrue(np.allclose(dec2, dec, rtol=0, atol=1E-8))
+        with self.assertRaises(ValueError):
+            FocalPlane(transform='spline')
+
+    @unittest.skipUnless(desimodel_available, desimodel_message)
+    def test_radec2pos(self):
+        """Test positioner coverage against a brute force calculation.
+        """
+        from astropy.table import Table
+        from .. import io
+        io_fiberpos_cache = io._fiberpos
+        #- fiducials and the ETC in fiberpos are not positioners, including
+        #- those next to the pointing center
+        fiberpos = Table(io.load_fiberpos(), copy=True)
+        fiberpos['DEVICE_TYPE'] = np.array(['POS'] * len(fiberpos))
+        center = np.argsort(np.hypot(fiberpos['X'], fiberpos['Y']))[0:3]
+        fiberpos['DEVICE_TYPE'][center] = ['FIF', 'GIF', 'ETC']
+        io._fiberpos = fiberpos
+        try:
+            self._check_radec2pos(fiberpos)
+        finally:
+            io._fiberpos = io_fiberpos_cache
+
+    def _check_radec2pos(self, fiberpos):
+        from .. import io
+        F = FocalPlane(150.0, 30.0)
+        patrol = io.load_desiparams()['positioners']['radius_max']
+        rng = np.random.RandomState(3)
+        ra = np.append(150.0 + rng.uniform(-2, 2, 2000), [150.0, 330.0, 10.0])
+        dec = np.append(30.0 + rng.uniform(-2, 2, 2000), [30.0, -30.0, -85.0])
+        x, y = F.radec2xy(ra, dec)
+        dist = np.hypot(x[:, None] - fiberpos['X'][None, :],
+                        y[:, None] - fiberpos['Y'][None, :])
+        #- exclude the antipode, which radec2xy maps back onto the plate
+        dist[-2] = np.inf
+        dist[:, fiberpos['DEVICE_TYPE'] != 'POS'] = np.inf
+        covered = dist <= patrol
+        positioners = np.asarray(fiberpos['POSITIONER'])
+
+        result = F.radec2pos(ra, dec)
+        self.assertEqual(len(result), len(ra))
+        for i in range(len(ra)):
+            self.assertEqual(list(result[i]), sorted(positioners[covered[i]]))
+        self.assertEqual(list(F.radec2pos(150.0, 30.0)), list(result[-3]))
+        self.assertEqual(len(F.radec2pos(330.0, -30.0)), 0)
+
+        offsets, pos, counts = F.radec2pos(ra, dec, output='csr')
+        self.assertTrue(np.all(counts == covered.sum(axis=1)))
+        self.assertTrue(np.all(pos == np.concatenate(result)))
+
+        targets = F.pos2targets(ra, dec)
+        self.assertEqual(len(targets), len(fiberpos))
+        for j in np.where(covered.any(axis=0))[0]:
+            self.assertEqual(list(targets[j]), list(np.where(covered[:, j])[0]))
+        offsets, itarget, counts = F.pos2targets(ra, dec, output='csr')
+        self.assertTrue(np.all(counts == covered.sum(axis=0)))
+        self.assertTrue(np.all(counts[fiberpos['DEVICE_TYPE'] != 'POS'] == 0))
+        #- no targets
+        self.assertEqual(F.radec2pos(np.zeros(0), np.zeros(0)), [])
+        offsets, pos, counts = F.radec2pos(np.zeros(0), np.zeros(0), output='csr')
+        self.assertEqual(list(offsets), [0])
+        self.assertEqual(len(F.pos2targets(np.zeros(0), np.zeros(0))), len(fiberpos))
+        with self.assertRaises(ValueError):
+            F.radec2pos(ra, dec, output='dict')
+
 
 def test_suite():
     """Allows testing of only this module with the command::
@@ -5,6 +5,7 @@ import numpy as np
 
 from .. import io
 from .. import footprint
+from .util import temp_cachedir
 
 desimodel_available = True
 desimodel_message = "The desimodel data set was not detected."
@@ -13,10 +14,20 @@ try:
 except KeyError:
     desimodel_available = False
 
+try:
+    import healpy
+    nohealpy = False
+except ImportError:
+    nohealpy = True
+
 class TestFootprint(unittest.TestCase):
     
     def setUp(self):
-        pass
+        #- mock tiles and random points around them shared by the tests
+        self.tiles = self._mock_tiles()
+        rng = np.random.RandomState(1234)
+        self.ra = rng.uniform(-5, 5, 1001) % 360
+        self.dec = rng.uniform(-5, 5, 1001)
             
     def test_get_tile_radec(self):
         """Test grabbing tile information by tileID.
@@ -39,6 +50,16 @@ class TestFootprint(unittest.TestCase):
         self.assertEqual((ra, dec), (0.0, 0.0))
         ra, dec, = footprint.get_tile_radec(2)
         self.assertEqual((ra, dec), (1.0, -1.0))
+        #- vectorized lookup, including missing and repeated tiles
+        ra, dec = footprint.get_tile_radec(np.array([3, 1, 2, 5, 3]))
+        self.assertEqual(list(ra), [2.0, 0.0, 1.0, 0.0, 2.0])
+        self.assertEqual(list(dec), [1.0, 0.0, -1.0, 0.0, 1.0])
+        #- TILEID index is rebuilt when the tiles cache changes
+        tiles2 = tiles.copy()
+        tiles2['RA'] += 10
+        io._tiles = tiles2
+        ra, dec = footprint.get_tile_radec(2)
+        self.assertEqual((ra, dec), (11.0, -1.0))
         io._tiles = io_tile_cache
 
     def test_is_point_in_desi_mock(self):
@@ -148,6 +169,308 @@ class TestFootprint(unittest.TestCase):
         self.assertEqual(len(ret), 1)
         self.assertEqual(ret[0], [])
 
+    def _mock_tiles(self):
+        tiles = np.zeros((4,), dtype=[('TILEID', 'i2'),
+                                      ('RA', 'f8'),
+                                      ('DEC', 'f8'),
+                                      ('IN_DESI', 'i2'),
+                                      ('PASS', 'i2'),
+                                      ('PROGRAM', (str, 6)),
+                                  ])
+
+        tiles['TILEID'] = np.arange(4) + 1
+        tiles['RA'] = [0.0, 1.0, 2.0, 3.0]
+        tiles['DEC'] = [-2.0, -1.0, 1.0, 2.0]
+        tiles['IN_DESI'] = [0, 1, 1, 0]
+        tiles['PASS'] = [0, 1, 0, 1]
+        tiles['PROGRAM'] = 'DARK'
+        return tiles
+
+    def test_tile_index(self):
+        """Test that a TileIndex is cached and reused by the queries.
+        """
+        tiles = self.tiles
+        index = footprint.get_tile_index(tiles, radius=1.605)
+        self.assertIsInstance(index, footprint.TileIndex)
+        self.assertEqual(len(index), len(tiles))
+        self.assertEqual(index.radius, 1.605)
+        #- same content and radius -> same cached object
+        self.assertIs(footprint.get_tile_index(tiles.copy(), radius=1.605), index)
+        self.assertIs(footprint.get_tile_index(index), index)
+        self.assertIsNot(footprint.get_tile_index(tiles, radius=1.0), index)
+        #- the KD-tree does not depend on the radius
+        self.assertIs(footprint.get_tile_index(tiles, radius=1.0).tree, index.tree)
+        #- only the most recently used tile sets are kept
+        for i in range(20):
+            shifted = tiles.copy()
+            shifted['RA'] += i + 1
+            footprint.get_tile_index(shifted, radius=1.605)
+        self.assertEqual(len(footprint._tile_index), footprint._tile_index.maxsize)
+        self.assertEqual(len(footprint._tile_tree), footprint._tile_tree.maxsize)
+        self.assertIsNot(footprint.get_tile_index(tiles, radius=1.605), index)
+        footprint.clear_caches()
+        self.assertEqual(len(footprint._tile_index), 0)
+        self.assertEqual(len(footprint._tile_tree), 0)
+
+        ra, dec = self.ra, self.dec
+        indesi1 = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605)
+        indesi2 = footprint.is_point_in_desi(index, ra, dec)
+        self.assertTrue(np.all(indesi1 == indesi2))
+
+        ret1 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605)
+        ret2 = footprint.find_tiles_over_point(index, ra, dec)
+        for a, b in zip(ret1, ret2):
+            self.assertEqual(sorted(a), sorted(b))
+
+        ret1 = footprint.find_points_in_tiles(tiles, ra, dec, radius=1.605)
+        ret2 = footprint.find_points_in_tiles(index, ra, dec)
+        for a, b in zip(ret1, ret2):
+            self.assertEqual(sorted(a), sorted(b))
+
+    def test_csr_output(self):
+        """Test output='csr' against the default list output.
+        """
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+
+        lists = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605)
+        offsets, indices, counts = footprint.find_tiles_over_point(
+            tiles, ra, dec, radius=1.605, output='csr', chunksize=300)
+        self.assertEqual(len(offsets), len(ra)+1)
+        self.assertEqual(len(counts), len(ra))
+        self.assertEqual(offsets[-1], len(indices))
+        for i, ii in enumerate(lists):
+            self.assertEqual(counts[i], len(ii))
+            self.assertEqual(list(indices[offsets[i]:offsets[i+1]]), sorted(ii))
+
+        lists = footprint.find_points_in_tiles(tiles, ra, dec, radius=1.605)
+        offsets, indices, counts = footprint.find_points_in_tiles(
+            tiles, ra, dec, radius=1.605, output='csr')
+        self.assertEqual(len(offsets), len(tiles)+1)
+        for i, ii in enumerate(lists):
+            self.assertEqual(counts[i], len(ii))
+            self.assertEqual(list(indices[offsets[i]:offsets[i+1]]), sorted(ii))
+
+        #- scalar input is a single row
+        offsets, indices, counts = footprint.find_tiles_over_point(
+            tiles, 0.0, -2.0, radius=1.605, output='csr')
+        self.assertEqual(list(offsets), [0, 2])
+        self.assertEqual(list(indices), [0, 1])
+
+        with self.assertRaises(ValueError):
+            footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605, output='dict')
+
+    def test_nproc(self):
+        """Test that threaded queries match the single threaded ones.
+        """
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+
+        indesi1, i1 = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605,
+                                                 return_tile_index=True)
+        indesi3, i3 = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605,
+                                                 return_tile_index=True, nproc=3)
+        self.assertTrue(np.all(indesi1 == indesi3))
+        self.assertTrue(np.all(i1 == i3))
+
+        lists1 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605)
+        lists3 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605, nproc=3)
+        self.assertEqual(len(lists1), len(lists3))
+        for a, b in zip(lists1, lists3):
+            self.assertEqual(sorted(a), sorted(b))
+
+        csr1 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+                                               output='csr')
+        csr3 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+                                               output='csr', nproc=3)
+        for a, b in zip(csr1, csr3):
+            self.assertTrue(np.all(a == b))
+
+        #- scalars ignore nproc
+        self.assertTrue(footprint.is_point_in_desi(tiles, 0.0, -2.0, radius=1.605,
+                                                   nproc=3))
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_spatial_sort(self):
+        """Test that spatially sorted queries match the unsorted ones.
+        """
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+
+        indesi1, i1 = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605,
+                                                 return_tile_index=True)
+        indesi2, i2 = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605,
+            return_tile_index=True, spatial_sort=True, nproc=2)
+        self.assertTrue(np.all(indesi1 == indesi2))
+        self.assertTrue(np.all(i1 == i2))
+        self.assertTrue(np.all(indesi1 == footprint.is_point_in_desi(
+            tiles, ra, dec, radius=1.605, spatial_sort=True)))
+
+        lists1 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605)
+        lists2 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+                                                 spatial_sort=True)
+        self.assertEqual(len(lists1), len(lists2))
+        for a, b in zip(lists1, lists2):
+            self.assertEqual(sorted(a), sorted(b))
+
+        csr1 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+                                               output='csr')
+        csr2 = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+            output='csr', chunksize=100, spatial_sort=True)
+        for a, b in zip(csr1, csr2):
+            self.assertTrue(np.all(a == b))
+
+    def test_tile_coverage_counts(self):
+        """Test per-point tile coverage counts, in total and by PASS.
+        """
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+        lists = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605)
+
+        counts = footprint.tile_coverage_counts(ra, dec, tiles, radius=1.605,
+                                                chunksize=300)
+        self.assertEqual(counts.shape, (len(ra),))
+        self.assertEqual(list(counts), [len(x) for x in lists])
+
+        passes, counts = footprint.tile_coverage_counts(ra, dec, tiles,
+            radius=1.605, by='PASS', nproc=2)
+        self.assertEqual(list(passes), [0, 1])
+        self.assertEqual(counts.shape, (len(ra), 2))
+        for i, ii in enumerate(lists):
+            for j, p in enumerate(passes):
+                self.assertEqual(counts[i, j], np.count_nonzero(tiles['PASS'][ii] == p))
+
+    def test_streaming(self):
+        """Test chunked streaming queries against full-array queries.
+        """
+        import tempfile
+        import shutil
+        from astropy.table import Table
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+        indesi = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605)
+        ntiles = footprint.find_tiles_over_point(tiles, ra, dec, radius=1.605,
+                                                 output='csr')[2]
+
+        chunks = footprint.iter_radec(ra, dec, chunksize=300)
+        result = list(footprint.iter_is_point_in_desi(tiles, chunks, radius=1.605))
+        self.assertEqual([len(x) for x in result], [300, 300, 300, 101])
+        self.assertTrue(np.all(np.concatenate(result) == indesi))
+
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'radec.fits')
+            Table(dict(RA=ra, DEC=dec)).write(filename)
+            chunks = footprint.iter_fits_radec(filename, chunksize=300)
+            result = footprint.iter_find_tiles_over_point(
+                tiles, chunks, radius=1.605, output='csr')
+            counts = np.concatenate([x[2] for x in result])
+            self.assertTrue(np.all(counts == ntiles))
+
+            chunks = footprint.iter_fits_radec(filename, chunksize=300,
+                                               rows=(250, 700))
+            result = list(footprint.iter_is_point_in_desi(tiles, chunks, radius=1.605))
+            self.assertEqual([len(x) for x in result], [300, 150])
+            self.assertTrue(np.all(np.concatenate(result) == indesi[250:700]))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_tile_overlap_graph(self):
+        """Test tile overlap graph against find_tiles_over_point.
+        """
+        tiles = self.tiles
+        offsets, indices, sep = footprint.tile_overlap_graph(tiles, radius=3.21)
+        self.assertEqual(list(offsets), [0, 1, 3, 5, 6])
+        self.assertEqual(list(indices), [1, 0, 2, 1, 3, 2])
+        self.assertTrue(np.allclose(sep[0:2], np.sqrt(2), rtol=1e-3))
+        self.assertIs(footprint.tile_overlap_graph(tiles.copy(), radius=3.21)[0], offsets)
+
+        rng = np.random.RandomState(1234)
+        tiles = np.zeros(500, dtype=[('RA', 'f8'), ('DEC', 'f8')])
+        tiles['RA'] = rng.uniform(0, 40, len(tiles))
+        tiles['DEC'] = rng.uniform(-20, 20, len(tiles))
+        with temp_cachedir() as tmpdir:
+            try:
+                offsets, indices, sep = footprint.tile_overlap_graph(tiles, radius=3.21)
+                self.assertEqual(len(os.listdir(tmpdir)), 3)
+                ret = footprint.find_tiles_over_point(tiles, tiles['RA'], tiles['DEC'],
+                                                      radius=3.21)
+                for i in range(len(tiles)):
+                    self.assertEqual(list(indices[offsets[i]:offsets[i+1]]),
+                                     sorted(set(ret[i]) - set([i])))
+                self.assertTrue(np.all(sep > 0) and np.all(sep < 3.21))
+
+                #- reloaded from disk
+                footprint._tile_overlap_graph.clear()
+                graph = footprint.tile_overlap_graph(tiles, radius=3.21)
+                self.assertIsNot(graph[0], offsets)
+                self.assertTrue(np.all(graph[1] == indices))
+                self.assertTrue(np.all(graph[2] == sep))
+            finally:
+                footprint._tile_overlap_graph.clear()
+
+    def test_tile_coverage(self):
+        """Test incremental TileCoverage against tile_coverage_counts.
+        """
+        rng = np.random.RandomState(1234)
+        tiles = np.zeros(100, dtype=[('TILEID', 'i4'), ('RA', 'f8'), ('DEC', 'f8')])
+        tiles['TILEID'] = rng.permutation(1000)[0:len(tiles)]
+        tiles['RA'] = rng.uniform(0, 20, len(tiles))
+        tiles['DEC'] = rng.uniform(-10, 10, len(tiles))
+        ra = rng.uniform(-2, 22, 5000) % 360
+        dec = rng.uniform(-12, 12, 5000)
+
+        cov = footprint.TileCoverage(ra, dec, tiles['TILEID'][0:10],
+                                     tiles=tiles, radius=1.605)
+        self.assertEqual(len(cov), 10)
+        self.assertTrue(tiles['TILEID'][0] in cov)
+        for night in range(1, 10):
+            changed = cov.insert(tiles['TILEID'][10*night:10*night+10])
+            if night % 3 == 0:
+                changed = cov.delete(tiles['TILEID'][10*night-5:10*night+5])
+            ii = np.in1d(tiles['TILEID'], cov.tileids)
+            counts = footprint.tile_coverage_counts(ra, dec, tiles[ii], radius=1.605)
+            self.assertTrue(np.all(cov.counts == counts))
+            self.assertTrue(np.all(cov.covered == (counts > 0)))
+            self.assertTrue(np.all(np.diff(changed) > 0))
+
+        #- repeated and missing tiles are ignored; unknown tiles are an error
+        counts = cov.counts.copy()
+        self.assertEqual(len(cov.insert(cov.tileids)), 0)
+        self.assertEqual(len(cov.delete([tiles['TILEID'][25]])), 0)
+        with self.assertRaises(ValueError):
+            cov.insert([1000])
+        self.assertTrue(np.all(cov.counts == counts))
+
+    def test_nearest_tiles(self):
+        """Test nearest_tiles against find_tiles_over_point.
+        """
+        tiles, ra, dec = self.tiles, self.ra, self.dec
+        radii = [1.0, 1.605]
+        indices, sep, masks = footprint.nearest_tiles(ra, dec, k=3, radii=radii,
+                                                      tiles=tiles, nproc=2)
+        self.assertEqual(indices.shape, (len(ra), 3))
+        self.assertEqual(sep.shape, (len(ra), 3))
+        self.assertEqual(masks.shape, (2, len(ra), 3))
+        self.assertTrue(np.all(np.diff(sep, axis=1) >= 0))
+        indesi, i = footprint.is_point_in_desi(tiles, ra, dec, radius=1.605,
+                                               return_tile_index=True)
+        self.assertTrue(np.all(indices[:, 0] == i))
+        self.assertTrue(np.all(masks[1, :, 0] == indesi))
+        for r, mask in zip(radii, masks):
+            ret = footprint.find_tiles_over_point(tiles, ra, dec, radius=r)
+            for j in range(len(ra)):
+                self.assertEqual(sorted(indices[j][mask[j]]), sorted(ret[j]))
+
+        #- separations are great-circle distances in degrees
+        cosd = (np.sin(np.radians(dec)) * np.sin(np.radians(tiles['DEC'][indices[:, 0]])) +
+                np.cos(np.radians(dec)) * np.cos(np.radians(tiles['DEC'][indices[:, 0]])) *
+                np.cos(np.radians(ra - tiles['RA'][indices[:, 0]])))
+        self.assertTrue(np.allclose(sep[:, 0], np.degrees(np.arccos(cosd)), atol=1e-6))
+
+        #- scalar input and more neighbors than tiles
+        i, s, m = footprint.nearest_tiles(ra[0], dec[0], k=5, radii=radii, tiles=tiles)
+        self.assertEqual(i.shape, (5,))
+        self.assertEqual(m.shape, (2, 5))
+        self.assertTrue(np.all(i[4:] == len(tiles)))
+        self.assertTrue(np.all(np.isinf(s[4:])))
+        self.assertFalse(np.any(m[:, 4:]))
+
     @unittest.skipUnless(desimodel_available, desimodel_message)
     def test_spatial_real_tiles(self):
         tiles = io.load_tiles()
@@ -4,9 +4,12 @@
 """
 from __future__ import print_function, division
 
+import os
 import unittest
 import numpy as np
-from ..footprint import tiles2pix, tileids2pix, pix2tiles, radec2pix
+from ..footprint import (tiles2pix, tileids2pix, pix2tiles, radec2pix,
+                         get_pix2tiles_index)
+from .util import temp_cachedir
 
 try:
     import healpy
@@ -57,6 +60,38 @@ class TestHealpix(unittest.TestCase):
         pix = tiles2pix(nside=16, tiles=tiles, radius=1.6)
         self.assertTrue( np.all(pix == np.array([785,788,789,791,832,1209,1211,1214,1215])) )
 
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_tiles2pix_nproc_cache(self):
+        """Test parallel tiles2pix and its on-disk cache"""
+        from .. import footprint
+        rng = np.random.RandomState(42)
+        tiles = np.zeros(50, dtype=[('RA', float), ('DEC', float)])
+        tiles['RA'] = rng.uniform(0, 360, len(tiles))
+        tiles['DEC'] = rng.uniform(-30, 80, len(tiles))
+
+        pix1 = tiles2pix(32, tiles, radius=1.6, per_tile=True)
+        footprint._tiles2pix_cache.clear()
+        pix2 = tiles2pix(32, tiles, radius=1.6, per_tile=True, nproc=2)
+        self.assertEqual(len(pix1), len(pix2))
+        for p1, p2 in zip(pix1, pix2):
+            self.assertListEqual(list(p1), list(p2))
+        #- per-tile arrays are independent copies of the cached pixels
+        self.assertTrue(pix1[0].flags.writeable)
+
+        with temp_cachedir() as cachedir:
+            try:
+                footprint._tiles2pix_cache.clear()
+                pix2 = tiles2pix(32, tiles, radius=1.6)
+                self.assertGreater(len(os.listdir(cachedir)), 0)
+                #- second call reads memory-mapped cache from disk
+                footprint._tiles2pix_cache.clear()
+                offsets, pixels = footprint._tiles2pix_csr(32, tiles, 1.6)
+                self.assertIsInstance(pixels, np.memmap)
+                self.assertListEqual(list(np.unique(pixels)), list(pix2))
+                self.assertListEqual(list(np.unique(np.concatenate(pix1))), list(pix2))
+            finally:
+                footprint._tiles2pix_cache.clear()
+
     @unittest.skipIf(nohealpy, 'healpy not installed')
     def test_radec2pix(self):
         """test radec2pix"""
@@ -78,6 +113,212 @@ class TestHealpix(unittest.TestCase):
                 tiles = pix2tiles(nside, pix)
                 self.assertIn(tileid, tiles['TILEID'], '{} not in pix2tiles({},{})'.format(tileid, nside, pix))
 
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_pix2tiles_index(self):
+        """test the cached pixel -> tile index against tiles2pix"""
+        tiles = np.zeros(3, dtype=[('RA', float), ('DEC', float)])
+        tiles['RA'] = [ 335.03,  333.22,  332.35]
+        tiles['DEC'] = [ 19.88,  14.84,  12.32]
+
+        nside = 16
+        pixels, offsets, tileindices = get_pix2tiles_index(nside, tiles, radius=1.6)
+        self.assertIs(get_pix2tiles_index(nside, tiles.copy(), radius=1.6)[0], pixels)
+        for x in (pixels, offsets, tileindices):
+            with self.assertRaises(ValueError):
+                x[0] = 0
+        self.assertListEqual(list(pixels), list(tiles2pix(nside, tiles, radius=1.6)))
+        pertile = tiles2pix(nside, tiles, radius=1.6, per_tile=True)
+        for i, p in enumerate(pixels):
+            ii = tileindices[offsets[i]:offsets[i+1]]
+            self.assertListEqual(list(ii), sorted(ii))
+            expected = [j for j in range(len(tiles)) if p in pertile[j]]
+            self.assertListEqual(list(ii), expected)
+
+        for pix in ([785, 1209], [788], 791):
+            expected = [j for j in range(len(tiles)) if np.any(np.in1d(pix, pertile[j]))]
+            result = pix2tiles(nside, pix, tiles, radius=1.6)
+            self.assertGreater(len(result), 0)
+            self.assertTrue(np.all(result == tiles[expected]))
+
+        #- pixels not covered by any tile
+        self.assertEqual(len(pix2tiles(nside, [0, 1], tiles, radius=1.6)), 0)
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_depth_map(self):
+        """test depth_map against summing tiles2pix per tile"""
+        from .. import footprint
+        rng = np.random.RandomState(1)
+        tiles = np.zeros(50, dtype=[('RA', float), ('DEC', float), ('EXPTIME', float)])
+        tiles['RA'] = rng.uniform(0, 20, len(tiles))
+        tiles['DEC'] = rng.uniform(-10, 10, len(tiles))
+        tiles['EXPTIME'] = rng.uniform(500, 1500, len(tiles))
+
+        nside = 32
+        expected = np.zeros(12*nside**2)
+        counts = np.zeros(12*nside**2)
+        for i, pix in enumerate(tiles2pix(nside, tiles, radius=1.6, per_tile=True)):
+            expected[pix] += tiles['EXPTIME'][i]
+            counts[pix] += 1
+
+        depth = footprint.depth_map(nside, 'EXPTIME', tiles, radius=1.6)
+        self.assertTrue(np.allclose(depth, expected))
+        depth = footprint.depth_map(nside, tiles['EXPTIME'] / 2, tiles, radius=1.6)
+        self.assertTrue(np.allclose(depth, expected / 2))
+        depth = footprint.depth_map(nside, tiles=tiles, radius=1.6)
+        self.assertTrue(np.all(depth == counts))
+        with self.assertRaises(ValueError):
+            footprint.depth_map(nside, np.ones(3), tiles, radius=1.6)
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_tile_coverage_map(self):
+        """test tile coverage map against pixel center coverage counts"""
+        import healpy as hp
+        from .. import footprint
+        tiles = np.zeros(3, dtype=[('RA', float), ('DEC', float), ('PASS', int)])
+        tiles['RA'] = [ 335.03,  333.22,  332.35]
+        tiles['DEC'] = [ 19.88,  14.84,  12.32]
+        tiles['PASS'] = [0, 1, 1]
+
+        nside = 32
+        counts = footprint.tile_coverage_map(nside, tiles, radius=1.6)
+        self.assertEqual(len(counts), hp.nside2npix(nside))
+        theta, phi = hp.pix2ang(nside, np.arange(len(counts)), nest=True)
+        ra, dec = np.degrees(phi), 90 - np.degrees(theta)
+        expected = footprint.tile_coverage_counts(ra, dec, tiles, radius=1.6)
+        self.assertTrue(np.all(counts == expected))
+        self.assertGreater(counts.sum(), 0)
+        #- every covered pixel center is also in tiles2pix
+        self.assertTrue(np.all(np.in1d(np.where(counts > 0)[0],
+                                       tiles2pix(nside, tiles, radius=1.6))))
+
+        passes, bypass = footprint.tile_coverage_map(nside, tiles, radius=1.6,
+                                                     by='PASS', nproc=2)
+        self.assertEqual(list(passes), [0, 1])
+        self.assertTrue(np.all(bypass.sum(axis=1) == counts))
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_pixweight(self):
+        """test fractional pixel weights against brute force sub-sampling"""
+        import healpy as hp
+        from .. import footprint
+        tiles = np.zeros(3, dtype=[('RA', float), ('DEC', float)])
+        tiles['RA'] = [ 335.03,  333.22,  332.35]
+        tiles['DEC'] = [ 19.88,  14.84,  12.32]
+
+        nside = 16
+        weight = footprint.pixweight(nside, tiles, radius=1.6, precision=0.01)
+        self.assertIs(footprint.pixweight(nside, tiles, radius=1.6, precision=0.01), weight)
+        self.assertEqual(len(weight), hp.nside2npix(nside))
+        self.assertTrue(np.all((weight >= 0) & (weight <= 1)))
+        #- only pixels touching a tile have weight
+        pix = tiles2pix(nside, tiles, radius=1.6)
+        self.assertTrue(np.all(np.in1d(np.where(weight > 0)[0], pix)))
+
+        #- 4**4 sub-pixels per pixel for precision 0.01
+        subpix = (np.arange(len(weight))[:, None]*256 + np.arange(256)).ravel()
+        theta, phi = hp.pix2ang(nside*16, subpix, nest=True)
+        indesi = footprint.is_point_in_desi(tiles, np.degrees(phi),
+                    90 - np.degrees(theta), radius=1.6)
+        expected = indesi.reshape(len(weight), 256).mean(axis=1)
+        self.assertTrue(np.allclose(weight, expected))
+
+        #- area of a single tile
+        weight1 = footprint.pixweight(nside, tiles[0:1], radius=1.6, precision=0.001)
+        area = weight1.sum() * hp.nside2pixarea(nside, degrees=True)
+        caparea = 2*np.pi*(1-np.cos(np.radians(1.6))) * (180/np.pi)**2
+        self.assertAlmostEqual(area / caparea, 1.0, delta=0.01)
+
+        weight2 = footprint.pixweight(nside, tiles, radius=1.6, precision=0.01/4, nproc=2)
+        self.assertTrue(np.allclose(weight, weight2, atol=0.01))
+
+        #- an explicit radius overrides the radius of a TileIndex
+        index = footprint.TileIndex(tiles, radius=1.6)
+        weight3 = footprint.pixweight(nside, tiles, radius=1.0)
+        self.assertTrue(np.all(footprint.pixweight(nside, index, radius=1.0) == weight3))
+        self.assertLess(weight3.sum(), weight.sum())
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_footprint_mask(self):
+        """test multi-order footprint mask against is_point_in_desi"""
+        from .. import footprint
+        rng = np.random.RandomState(42)
+        tiles = np.zeros(200, dtype=[('RA', float), ('DEC', float)])
+        tiles['RA'] = rng.uniform(0, 60, len(tiles))
+        tiles['DEC'] = rng.uniform(-10, 30, len(tiles))
+
+        mask = footprint.FootprintMask(tiles, radius=1.6, nside=8, maxnside=64)
+        self.assertEqual(mask.nsides, [8, 16, 32, 64])
+        self.assertEqual(len(mask.states[0]), 12*8**2)
+        for k in range(1, len(mask.nsides)):
+            self.assertEqual(len(mask.pixels[k]),
+                4*np.count_nonzero(mask.states[k-1] == mask.BOUNDARY))
+
+        ra = rng.uniform(-10, 70, 20000) % 360
+        dec = rng.uniform(-20, 40, 20000)
+        indesi = footprint.is_point_in_desi(tiles, ra, dec, radius=1.6)
+        self.assertTrue(np.all(mask.contains(ra, dec) == indesi))
+        states = mask.state(ra, dec)
+        self.assertTrue(np.all(indesi[states == mask.IN]))
+        self.assertFalse(np.any(indesi[states == mask.OUT]))
+        self.assertEqual(mask.contains(ra[0], dec[0]), indesi[0])
+
+        with temp_cachedir() as tmpdir:
+            try:
+                filename = os.path.join(tmpdir, 'mask.fits')
+                mask.write(filename)
+                mask2 = footprint.FootprintMask.read(filename)
+                self.assertEqual(mask2.nsides, mask.nsides)
+                self.assertEqual(mask2.radius, mask.radius)
+                self.assertTrue(np.all(mask2.state(ra, dec) == states))
+                self.assertTrue(np.all(mask2.contains(ra, dec) == indesi))
+
+                #- cached in memory and on disk
+                footprint._footprint_mask.clear()
+                mask3 = footprint.get_footprint_mask(tiles, radius=1.6, nside=8, maxnside=64)
+                self.assertIs(footprint.get_footprint_mask(tiles, radius=1.6, nside=8, maxnside=64), mask3)
+                self.assertEqual(len(os.listdir(tmpdir)), 2)
+                footprint._footprint_mask.clear()
+                mask4 = footprint.get_footprint_mask(tiles, radius=1.6, nside=8, maxnside=64)
+                self.assertIsNot(mask4, mask3)
+                self.assertTrue(np.all(mask4.state(ra, dec) == states))
+            finally:
+                footprint._footprint_mask.clear()
+
+    @unittest.skipIf(nohealpy, 'healpy not installed')
+    def test_random_points(self):
+        """test footprint random generator"""
+        from .. import footprint
+        rng = np.random.RandomState(42)
+        tiles = np.zeros(50, dtype=[('RA', float), ('DEC', float)])
+        tiles['RA'] = rng.uniform(0, 30, len(tiles))
+        tiles['DEC'] = rng.uniform(-10, 10, len(tiles))
+        kw = dict(tiles=tiles, radius=1.6, nside=8, maxnside=64)
+
+        chunks = list(footprint.random_points(25000, seed=1, chunksize=10000, **kw))
+        self.assertEqual([len(ra) for ra, dec in chunks], [10000, 10000, 5000])
+        ra = np.concatenate([c[0] for c in chunks])
+        dec = np.concatenate([c[1] for c in chunks])
+        self.assertTrue(np.all(footprint.is_point_in_desi(tiles, ra, dec, radius=1.6)))
+        self.assertEqual(len(np.unique(radec2pix(2**29, ra, dec))), len(ra))
+
+        #- chunks are reproducible individually, and differ by seed
+        ra2, dec2 = next(footprint.random_points(25000, seed=1, chunksize=10000,
+                                                 chunks=[1], **kw))
+        self.assertTrue(np.all(ra2 == chunks[1][0]))
+        self.assertTrue(np.all(dec2 == chunks[1][1]))
+        ra3, dec3 = next(footprint.random_points(25000, seed=2, chunksize=10000, **kw))
+        self.assertFalse(np.any(ra3 == chunks[0][0]))
+        with self.assertRaises(ValueError):
+            list(footprint.random_points(25000, chunksize=10000, chunks=[3], **kw))
+
+        #- uniform: each tile gets points in proportion to its unique area
+        weight = footprint.pixweight(64, tiles, radius=1.6, precision=0.001)
+        pix = radec2pix(64, ra, dec)
+        counts = np.bincount(pix, minlength=len(weight))
+        ii = weight == 1
+        expected = len(ra) * ii.sum() / weight.sum()
+        self.assertLess(abs(counts[ii].sum() - expected), 5*np.sqrt(expected))
+
 def test_suite():
     """Allows testing of only this module with the command::
         python setup.py test -m <modulename>
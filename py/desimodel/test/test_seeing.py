@@ -6,7 +6,9 @@ from __future__ import print_function, division
 
 import unittest
 import numpy as np
-from ..seeing import relative_probability, sample
+import scipy.special
+from ..seeing import (relative_probability, sample, sample_stream, scaled_fwhm,
+                      _get_cdf_table, _unwhiten)
 
 
 class TestSeeing(unittest.TestCase):
@@ -40,6 +42,103 @@ class TestSeeing(unittest.TestCase):
         self.assertTrue(np.allclose(bin_prob, expected, rtol=1e-2, atol=1e-2))
 
 
+    def test_cdf_cache(self):
+        """Test that cached un-whitening matches the direct calculation.
+        """
+        table = _get_cdf_table(5., 0.219)
+        self.assertIs(_get_cdf_table(5, 0.219), table)
+        self.assertIsNot(_get_cdf_table(5., 0.), table)
+        seeing_grid, seeing_cdf, x_table = table
+        self.assertTrue(np.all(np.diff(x_table) >= 0))
+        self.assertAlmostEqual(x_table[0], 0.)
+        self.assertAlmostEqual(x_table[-1], 5.)
+        # Compare with un-whitening via the Gaussian CDF.
+        x = np.random.RandomState(1).normal(size=10000)
+        x_cdf = 0.5 * (1 + scipy.special.erf(x / np.sqrt(2)))
+        expected = np.interp(x_cdf, seeing_cdf, seeing_grid)
+        self.assertTrue(np.allclose(_unwhiten(x, x_table), expected,
+                                    rtol=0, atol=1e-4))
+        # Samples depend on the blur.
+        s1 = sample(1000, seed=1)
+        s2 = sample(1000, seed=1, blur_arcsec=0.)
+        self.assertTrue(np.all(s1 == sample(1000, seed=1)))
+        self.assertFalse(np.all(s1 == s2))
+
+
+    def test_realizations(self):
+        """Test batched generation of independent realizations.
+        """
+        samples = sample(20000, seed=123, n_realizations=5)
+        self.assertEqual(samples.shape, (5, 20000))
+        self.assertEqual(samples.dtype, np.float64)
+        self.assertTrue(np.all((samples >= 0) & (samples <= 5.)))
+        # Realizations do not depend on how many are generated.
+        samples32 = sample(20000, seed=123, n_realizations=3, dtype=np.float32)
+        self.assertEqual(samples32.dtype, np.float32)
+        self.assertTrue(np.allclose(samples32, samples[:3], rtol=1e-6))
+        # Realizations are uncorrelated with each other.
+        corr = np.corrcoef(samples)
+        self.assertTrue(np.all(np.abs(corr[np.triu_indices(5, 1)]) < 0.2))
+        # The default 1D output is unchanged.
+        self.assertEqual(sample(100, seed=1).shape, (100,))
+        self.assertEqual(sample(100, seed=1, dtype=np.float32).dtype, np.float32)
+        with self.assertRaises(ValueError):
+            sample(100, n_realizations=0)
+
+
+    def test_stream(self):
+        """Test that streamed samples have the expected PDF and PSD.
+        """
+        import itertools
+        stream = sample_stream(chunk_size=100000, seed=123)
+        samples = np.concatenate(list(itertools.islice(stream, 10)))
+        self.assertEqual(len(samples), 1000000)
+        # Chunks are continuous, so the series does not depend on chunk_size.
+        stream = sample_stream(chunk_size=999, seed=123)
+        samples2 = np.concatenate(list(itertools.islice(stream, 100)))
+        self.assertTrue(np.allclose(samples2, samples[:len(samples2)]))
+        # Check for expected bin counts as in test_samples.
+        bin_edges = np.linspace(0., 10., 51)
+        bin_prob, _ = np.histogram(samples, bin_edges, density=True)
+        bin_prob *= bin_edges[1]
+        fwhm = np.linspace(0., 10., 10 * len(bin_prob) + 1)
+        fwhm_midpt = 0.5 * (fwhm[:-1] + fwhm[1:])
+        pdf = relative_probability(fwhm_midpt)
+        expected = pdf.reshape(len(bin_prob), -1).sum(axis=1)
+        self.assertTrue(np.allclose(bin_prob, expected, rtol=1e-2, atol=1e-2))
+        # Compare autocorrelations with the FFT based samples.
+        batch = sample(len(samples), seed=123)
+        for lag in (1, 10, 100):
+            acf = [np.corrcoef(x[:-lag], x[lag:])[0, 1] for x in (samples, batch)]
+            self.assertAlmostEqual(acf[0], acf[1], delta=0.05)
+        with self.assertRaises(ValueError):
+            next(sample_stream(chunk_size=0))
+
+
+    def test_scaled_fwhm(self):
+        """Test airmass and wavelength scaling of seeing.
+        """
+        fwhm = sample(10, seed=1)
+        airmass = np.linspace(1., 2., 10)
+        wave = np.linspace(3600., 9800., 50)
+        scaled = scaled_fwhm(fwhm, airmass, wave)
+        self.assertEqual(scaled.shape, (10, 50))
+        for i in range(len(fwhm)):
+            for j in (0, 25, 49):
+                self.assertAlmostEqual(
+                    scaled[i, j],
+                    fwhm[i] * airmass[i] ** 0.6 * (6355. / wave[j]) ** 0.2)
+        self.assertTrue(np.allclose(scaled_fwhm(fwhm, 1., 6355.)[:, 0], fwhm))
+        self.assertEqual(scaled_fwhm(1.1, 1.2, wave).shape, (1, 50))
+        # Results can be written into an existing array.
+        out = np.empty((10, 50), dtype=np.float32)
+        result = scaled_fwhm(fwhm, airmass, wave, out=out)
+        self.assertIs(result, out)
+        self.assertTrue(np.allclose(out, scaled, rtol=1e-6))
+        with self.assertRaises(ValueError):
+            scaled_fwhm(fwhm, airmass, wave, out=np.empty((50, 10)))
+
+
 def test_suite():
     """Allows testing of only this module with the command::
         python setup.py test -m <modulename>
@@ -0,0 +1,32 @@
+# Licensed under a 3-clause BSD style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+desimodel.test.util
+===================
+
+Utilities shared by the desimodel unit tests.
+"""
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+
+@contextmanager
+def temp_cachedir():
+    """Point $DESIMODEL_CACHE at a new temporary directory.
+
+    Yields the directory name; the previous value of $DESIMODEL_CACHE is
+    restored and the directory removed on exit.
+    """
+    tmpdir = tempfile.mkdtemp()
+    origcache = os.environ.get('DESIMODEL_CACHE')
+    os.environ['DESIMODEL_CACHE'] = tmpdir
+    try:
+        yield tmpdir
+    finally:
+        if origcache is None:
+            del os.environ['DESIMODEL_CACHE']
+        else:
+            os.environ['DESIMODEL_CACHE'] = origcache
+        shutil.rmtree(tmpdir)